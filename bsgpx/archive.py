@@ -0,0 +1,319 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import gpx
+
+SUMMARY_COLUMNS = ('length2d', 'upHill', 'downHill', 'duration', 'startTime', 'minLat', 'maxLat', 'minLon', 'maxLon')
+
+class GpxArchiveIndex:
+    """Persistent (SQLite) index of summaries of GPX files in directory tree
+
+    Files are identified by path and considered unchanged while size
+    and mtime match the indexed values, so re-indexing parses only new
+    and modified files. Times are stored as seconds since epoch.
+    """
+
+    EXTENSION = '.gpx'
+
+    # number of indexed files committed in one transaction
+    COMMIT_INTERVAL = 1000
+
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            error TEXT,
+            tracks INTEGER,
+            length2d REAL, upHill REAL, downHill REAL, duration REAL, startTime REAL,
+            minLat REAL, maxLat REAL, minLon REAL, maxLon REAL)''',
+        '''CREATE TABLE IF NOT EXISTS tracks (
+            path TEXT NOT NULL REFERENCES files(path) ON DELETE CASCADE,
+            ix INTEGER NOT NULL,
+            name TEXT,
+            length2d REAL, upHill REAL, downHill REAL, duration REAL, startTime REAL,
+            minLat REAL, maxLat REAL, minLon REAL, maxLon REAL,
+            PRIMARY KEY (path, ix))''',
+        'CREATE INDEX IF NOT EXISTS files_start ON files(startTime)',
+        'CREATE INDEX IF NOT EXISTS files_bounds ON files(minLat, maxLat)',
+    ]
+
+    def __init__(self, dbPath=':memory:'):
+        self.db = sqlite3.connect(dbPath)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute('PRAGMA foreign_keys = ON')
+        for sql in self.SCHEMA:
+            self.db.execute(sql)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def summarizeTrack(track):
+        """Summary of single track as tuple of values ordered as SUMMARY_COLUMNS"""
+        (upHill, downHill) = track.getUpDownHill()
+        bounds = track.getBounds()
+        return (track.length2d(), upHill, downHill, track.getDuration(),
+            gpx.toSeconds(track.getStartTime())) + bounds
+
+    @staticmethod
+    def summarizeFile(trackSummaries):
+        """Aggregate summaries of tracks to summary of file"""
+        def agg(fn, ix):
+            values = [s[ix] for s in trackSummaries if s[ix] is not None]
+            return fn(values) if values else None
+
+        return (agg(sum, 0), agg(sum, 1), agg(sum, 2), agg(sum, 3), agg(min, 4),
+            agg(min, 5), agg(max, 6), agg(min, 7), agg(max, 8))
+
+    def indexFile(self, path, size=None, mtime=None):
+        """Parse file and (re)place its summaries in index"""
+        try:
+            result = self._indexFile(path, size, mtime)
+        except:
+            self.db.rollback()
+            raise
+        self.db.commit()
+        return result
+
+    def _indexFile(self, path, size=None, mtime=None):
+        """Parse file and (re)place its summaries in index, changes are not committed"""
+        path = os.path.abspath(path)
+        if size is None or mtime is None:
+            st = os.stat(path)
+            size = st.st_size
+            mtime = st.st_mtime
+
+        error = None
+        trackSummaries = []
+        try:
+            reader = gpx.GpxReaderXml(path)
+            for track in reader.gpx.tracks:
+                trackSummaries.append((track.name, self.summarizeTrack(track)))
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+            trackSummaries = []
+
+        fileSummary = self.summarizeFile([s for _, s in trackSummaries]) if error is None else (None,) * len(SUMMARY_COLUMNS)
+
+        self.db.execute('DELETE FROM files WHERE path = ?', (path,))
+        self.db.execute('INSERT INTO files (path, size, mtime, error, tracks, %s) VALUES (?, ?, ?, ?, ?, %s)' %
+            (', '.join(SUMMARY_COLUMNS), ', '.join('?' * len(SUMMARY_COLUMNS))),
+            (path, size, mtime, error, len(trackSummaries)) + fileSummary)
+        self.db.executemany('INSERT INTO tracks (path, ix, name, %s) VALUES (?, ?, ?, %s)' %
+            (', '.join(SUMMARY_COLUMNS), ', '.join('?' * len(SUMMARY_COLUMNS))),
+            [(path, ix, name) + summary for ix, (name, summary) in enumerate(trackSummaries)])
+
+        return error is None
+
+    def update(self, directory):
+        """
+        Synchronize index with GPX files in directory tree.
+
+        Returns tuple (indexed, unchanged, removed, failed) with counts of files.
+        """
+        directory = os.path.abspath(directory)
+
+        # exact (case sensitive) prefix match, LIKE would treat `_` and `%` as wildcards
+        prefix = directory if directory.endswith(os.sep) else directory + os.sep
+        indexed = dict((row['path'], (row['size'], row['mtime'])) for row in
+            self.db.execute('SELECT path, size, mtime FROM files WHERE substr(path, 1, ?) = ?', (len(prefix), prefix)))
+
+        counts = {'indexed': 0, 'unchanged': 0, 'failed': 0}
+        seen = set()
+        pending = 0
+        try:
+            for root, dirs, files in os.walk(directory):
+                for name in files:
+                    if not name.lower().endswith(self.EXTENSION):
+                        continue
+                    path = os.path.join(root, name)
+                    st = os.stat(path)
+                    seen.add(path)
+                    if indexed.get(path) == (st.st_size, st.st_mtime):
+                        counts['unchanged'] += 1
+                        continue
+
+                    if self._indexFile(path, st.st_size, st.st_mtime):
+                        counts['indexed'] += 1
+                    else:
+                        counts['failed'] += 1
+
+                    # changes are committed in batches, not per file
+                    pending += 1
+                    if pending >= self.COMMIT_INTERVAL:
+                        self.db.commit()
+                        pending = 0
+
+            removed = [path for path in indexed if path not in seen]
+            self.db.executemany('DELETE FROM files WHERE path = ?', [(path,) for path in removed])
+        except:
+            self.db.rollback()
+            raise
+        self.db.commit()
+
+        return (counts['indexed'], counts['unchanged'], len(removed), counts['failed'])
+
+    @staticmethod
+    def _rowToDict(row):
+        result = dict(zip(row.keys(), row))
+        if result.get('startTime') is not None:
+            result['startTime'] = datetime.datetime.utcfromtimestamp(result['startTime'])
+        return result
+
+    def getFile(self, path):
+        row = self.db.execute('SELECT * FROM files WHERE path = ?', (os.path.abspath(path),)).fetchone()
+        return self._rowToDict(row) if row is not None else None
+
+    def getTracks(self, path):
+        rows = self.db.execute('SELECT * FROM tracks WHERE path = ? ORDER BY ix', (os.path.abspath(path),))
+        return [self._rowToDict(row) for row in rows]
+
+    def query(self, startFrom=None, startTo=None, bbox=None):
+        """
+        Summaries of successfully parsed files ordered by start time.
+
+        startFrom and startTo (datetime) limit start time (inclusive),
+        bbox (minLat, maxLat, minLon, maxLon) selects files whose bounds
+        intersect given box.
+        """
+        where = ['error IS NULL']
+        params = []
+        if startFrom is not None:
+            where.append('startTime >= ?')
+            params.append(gpx.toSeconds(startFrom))
+        if startTo is not None:
+            where.append('startTime <= ?')
+            params.append(gpx.toSeconds(startTo))
+        if bbox is not None:
+            (minLat, maxLat, minLon, maxLon) = bbox
+            where.append('maxLat >= ? AND minLat <= ? AND maxLon >= ? AND minLon <= ?')
+            params.extend([minLat, maxLat, minLon, maxLon])
+
+        rows = self.db.execute('SELECT * FROM files WHERE %s ORDER BY startTime, path' % ' AND '.join(where), params)
+        return [self._rowToDict(row) for row in rows]
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    TEMPLATE = ('<gpx>\n'
+                '  <trk>\n'
+                '    <name>%s</name>\n'
+                '    <trkseg>\n'
+                '      <trkpt lat="%s" lon="16"><ele>200</ele><time>%sT10:00:00Z</time></trkpt>\n'
+                '      <trkpt lat="%s" lon="16.01"><ele>250</ele><time>%sT11:00:00Z</time></trkpt>\n'
+                '    </trkseg>\n'
+                '  </trk>\n'
+                '</gpx>\n')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def writeGpx(self, name, lat, date):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(self.TEMPLATE % (name, lat, date, lat + 0.01, date))
+        return path
+
+    def testIndex(self):
+        p1 = self.writeGpx('a.gpx', 49, '2015-02-23')
+        p2 = self.writeGpx('b.gpx', 50, '2015-03-01')
+        with open(os.path.join(self.dir, 'bad.gpx'), 'w') as f:
+            f.write('<gpx><trk>')
+        with open(os.path.join(self.dir, 'other.txt'), 'w') as f:
+            f.write('x')
+
+        index = GpxArchiveIndex(os.path.join(self.dir, 'index.db'))
+        self.assertEqual(index.update(self.dir), (2, 0, 0, 1))
+        self.assertEqual(index.update(self.dir), (0, 3, 0, 0))
+
+        f = index.getFile(p1)
+        self.assertEqual(f['tracks'], 1)
+        self.assertEqual(f['duration'], 3600)
+        self.assertEqual(f['startTime'], datetime.datetime(2015, 2, 23, 10, 0, 0))
+        self.assertEqual(f['minLat'], 49)
+        self.assertTrue(f['length2d'] > 1000)
+        self.assertEqual(index.getTracks(p1)[0]['name'], 'a.gpx')
+        self.assertIsNotNone(index.getFile(os.path.join(self.dir, 'bad.gpx'))['error'])
+
+        self.assertEqual(len(index.query()), 2)
+        self.assertEqual([f['path'] for f in index.query(startFrom=datetime.datetime(2015, 2, 24))], [p2])
+        self.assertEqual([f['path'] for f in index.query(startTo=datetime.datetime(2015, 2, 24))], [p1])
+        self.assertEqual([f['path'] for f in index.query(bbox=(49.005, 49.5, 15, 17))], [p1])
+        self.assertEqual(index.query(bbox=(0, 1, 0, 1)), [])
+
+        # modified and removed files
+        os.remove(p1)
+        self.writeGpx('b.gpx', 51, '2015-03-01')
+        os.utime(p2, (0, 0))
+        self.assertEqual(index.update(self.dir), (1, 1, 1, 0))
+        self.assertIsNone(index.getFile(p1))
+        self.assertEqual(index.getTracks(p1), [])
+        self.assertEqual(index.getFile(p2)['minLat'], 51)
+        index.close()
+
+        # index is persistent
+        index = GpxArchiveIndex(os.path.join(self.dir, 'index.db'))
+        self.assertEqual(index.update(self.dir), (0, 2, 0, 0))
+        index.close()
+
+    def testSiblingDirectories(self):
+        # names which match each other as LIKE patterns (wildcard, case)
+        dirs = ['a_b', 'aXb', 'Rides', 'rides', 'rides2']
+        paths = []
+        for d in dirs:
+            os.mkdir(os.path.join(self.dir, d))
+            paths.append(self.writeGpx(os.path.join(d, 't.gpx'), 49, '2015-02-23'))
+
+        index = GpxArchiveIndex()
+        for d in dirs:
+            self.assertEqual(index.update(os.path.join(self.dir, d)), (1, 0, 0, 0))
+        for d in dirs:
+            self.assertEqual(index.update(os.path.join(self.dir, d)), (0, 1, 0, 0))
+        for path in paths:
+            self.assertIsNotNone(index.getFile(path))
+
+        os.remove(paths[0])
+        self.assertEqual(index.update(os.path.join(self.dir, 'a_b')), (0, 0, 1, 0))
+        self.assertEqual(len(index.query()), 4)
+        index.close()
+
+    def testBatchCommit(self):
+        for i in xrange(5):
+            self.writeGpx('%d.gpx' % i, 49, '2015-02-23')
+
+        index = GpxArchiveIndex(os.path.join(self.dir, 'index.db'))
+        index.COMMIT_INTERVAL = 2
+        commits = []
+        db = index.db
+
+        class CountingConnection:
+            def __getattr__(self, name):
+                return getattr(db, name)
+
+            def commit(self):
+                commits.append(1)
+                db.commit()
+
+        index.db = CountingConnection()
+        self.assertEqual(index.update(self.dir), (5, 0, 0, 0))
+        # two full batches and final commit
+        self.assertEqual(len(commits), 3)
+        index.db = db
+        index.close()
+
+        index = GpxArchiveIndex(os.path.join(self.dir, 'index.db'))
+        self.assertEqual(len(index.query()), 5)
+        index.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# commands producing text output, served by server (see textcommands.COMMANDS)
+# client imports only standard library, so the call is not slowed down by
+# import of gpx, geo and numpy
+TEXT_COMMANDS = ('ele', 'list', 'print')
+
+def parseAddress(address):
+    """
+    Address is either path of unix socket or `host:port`.
+
+    Server opens any path sent by client, so only loopback hosts
+    (localhost, 127.x.x.x) are accepted.
+    """
+    if ':' in address and '/' not in address:
+        (host, port) = address.rsplit(':', 1)
+        host = host or 'localhost'
+        if host != 'localhost' and not re.match(r'^127\.\d{1,3}\.\d{1,3}\.\d{1,3}$', host):
+            raise ValueError('Only loopback host is allowed: %s' % host)
+        return (host, int(port))
+    return address
+
+def request(address, path, cmds):
+    """
+    Send request to running server, returns output of commands
+
+    Raises socket.error if server is not running, RuntimeError if request
+    failed on server.
+    """
+    address = parseAddress(address)
+    if isinstance(address, tuple):
+        sock = socket.create_connection(address)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        if not isinstance(address, tuple):
+            sock.connect(address)
+        f = sock.makefile('rw')
+        f.write(json.dumps({'path': os.path.abspath(path), 'commands': list(cmds)}) + '\n')
+        f.flush()
+        response = json.loads(f.readline())
+        f.close()
+    finally:
+        sock.close()
+
+    if not response['ok']:
+        raise RuntimeError(response['error'])
+    return response['output']
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    def testAddress(self):
+        self.assertEqual(parseAddress('/tmp/gpx.sock'), '/tmp/gpx.sock')
+        self.assertEqual(parseAddress('localhost:9000'), ('localhost', 9000))
+        self.assertEqual(parseAddress(':9000'), ('localhost', 9000))
+        self.assertEqual(parseAddress('127.0.0.1:9000'), ('127.0.0.1', 9000))
+        self.assertRaises(ValueError, parseAddress, '0.0.0.0:9000')
+        self.assertRaises(ValueError, parseAddress, '192.168.1.1:9000')
+        self.assertRaises(ValueError, parseAddress, '127.evil.com:9000')
+
+    def testNoServer(self):
+        address = os.path.join(tempfile.gettempdir(), 'bsgpx-none-%d.sock' % os.getpid())
+        self.assertRaises(socket.error, request, address, 'a.gpx', ['list'])
+
+        # free port, nobody listens on it
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        self.assertRaises(socket.error, request, '127.0.0.1:%d' % port, 'a.gpx', ['list'])
+
+        # command line client reports error without traceback
+        cli = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'gpxcli.py')
+        process = subprocess.Popen([sys.executable, cli, '-S', address, 'a.gpx', 'list'],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        (_, err) = process.communicate()
+        self.assertEqual(process.returncode, 2)
+        self.assertTrue('error:' in err)
+        self.assertFalse('Traceback' in err)
+
+if __name__ == '__main__':
+    unittest.main()
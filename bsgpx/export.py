@@ -0,0 +1,267 @@
+import StringIO
+import itertools
+import os.path
+import shutil
+import tempfile
+import unittest
+import xml.dom.minidom
+import zipfile
+import geo
+import gpx
+
+try:
+    import numpy
+    import numpy.lib.format
+except ImportError:
+    numpy = None
+
+COLUMNS = ('track', 'segment', 'lat', 'lon', 'ele', 'time', 'distance')
+
+FORMAT_CSV = 'csv'
+FORMAT_NPZ = 'npz'
+FORMATS = (FORMAT_CSV, FORMAT_NPZ)
+
+# fixed precision: ~1 cm for coordinates, cm for elevation and distance, ms for time
+# ele and time columns are formatted in advance, missing values are written as empty fields
+CSV_ROW_FORMAT = '%d,%d,%.7f,%.7f,%s,%s,%.2f\r\n'
+CSV_ELE_FORMAT = '%.2f'
+CSV_TIME_FORMAT = '%.3f'
+
+# number of rows formatted by one operation
+CSV_CHUNK_SIZE = 10000
+
+def iterSegmentColumns(gpxData, model=None, asArrays=False):
+    """
+    Generate columns of all track segments.
+
+    Yields one tuple per segment with items ordered as in COLUMNS. Values
+    are plain lists (None for missing ele and time) or numpy arrays if
+    asArrays is set (nan for missing values, numpy is required). Time is
+    in seconds since epoch, distance is cumulative 2d distance from the
+    start of the track.
+    """
+    if asArrays and numpy is None:
+        raise RuntimeError('numpy is required for array output')
+
+    for trackIx, track in enumerate(gpxData.tracks):
+        offset = 0.0
+        for segmentIx, segment in enumerate(track.segments):
+            n = len(segment.points)
+            if n == 0:
+                continue
+
+            lats = [p.lat for p in segment.points]
+            lons = [p.lon for p in segment.points]
+            eles = [p.ele for p in segment.points]
+            times = segment.getTimes()
+
+            if numpy is not None:
+                dists = numpy.empty(n)
+                dists[0] = 0.0
+                numpy.cumsum(geo.distances(lats, lons, None, model, asArray=True), out=dists[1:])
+                dists += offset
+                offset = dists[-1]
+                if asArrays:
+                    yield (numpy.full(n, trackIx, dtype='<i8'), numpy.full(n, segmentIx, dtype='<i8'),
+                        numpy.array(lats, dtype=float), numpy.array(lons, dtype=float),
+                        numpy.array(eles, dtype=float), numpy.array(times, dtype=float), dists)
+                    continue
+                dists = dists.tolist()
+            else:
+                dists = [offset]
+                total = offset
+                for d in geo.distances(lats, lons, None, model):
+                    total += d
+                    dists.append(total)
+                offset = total
+
+            yield ([trackIx] * n, [segmentIx] * n, lats, lons, eles, times, dists)
+
+def exportCsv(gpxData, f, model=None):
+    """
+    Write points of all tracks as CSV rows to file object f.
+
+    Rows are formatted in chunks by single string formatting operation,
+    segments are written one by one.
+    """
+    f.write(','.join(COLUMNS) + '\r\n')
+    for (tracks, segments, lats, lons, eles, times, dists) in iterSegmentColumns(gpxData, model):
+        eles = ['' if v is None else CSV_ELE_FORMAT % v for v in eles]
+        times = ['' if v is None else CSV_TIME_FORMAT % v for v in times]
+        rows = zip(tracks, segments, lats, lons, eles, times, dists)
+        for start in xrange(0, len(rows), CSV_CHUNK_SIZE):
+            chunk = rows[start:start + CSV_CHUNK_SIZE]
+            f.write((CSV_ROW_FORMAT * len(chunk)) % tuple(itertools.chain.from_iterable(chunk)))
+
+def exportNpz(gpxData, f, model=None):
+    """
+    Write points of all tracks as NumPy arrays (one per column) to file (path or object) f.
+
+    Columns are streamed per segment to temporary .npy files which are
+    stored to the npz (zip) archive at the end, so all points are never
+    held in memory at once.
+    """
+    if numpy is None:
+        raise RuntimeError('numpy is required for npz export')
+
+    n = sum(len(s.points) for t in gpxData.tracks for s in t.segments)
+    dtypes = dict((c, numpy.dtype('<i8' if c in ('track', 'segment') else '<f8')) for c in COLUMNS)
+
+    tmpDir = tempfile.mkdtemp()
+    try:
+        files = {}
+        for c in COLUMNS:
+            files[c] = open(os.path.join(tmpDir, c + '.npy'), 'wb')
+            numpy.lib.format.write_array_header_1_0(files[c],
+                {'descr': numpy.lib.format.dtype_to_descr(dtypes[c]), 'fortran_order': False, 'shape': (n,)})
+
+        for columns in iterSegmentColumns(gpxData, model, asArrays=True):
+            for c, values in zip(COLUMNS, columns):
+                files[c].write(values.astype(dtypes[c], copy=False).tostring())
+
+        for c in COLUMNS:
+            files[c].close()
+
+        zf = zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED, allowZip64=True)
+        for c in COLUMNS:
+            zf.write(os.path.join(tmpDir, c + '.npy'), c + '.npy')
+        zf.close()
+    finally:
+        shutil.rmtree(tmpDir)
+
+def getFormat(path):
+    """Export format detected from file extension, None if it is not supported"""
+    fmt = os.path.splitext(path)[1][1:].lower()
+    return fmt if fmt in FORMATS else None
+
+def export(gpxData, path, fmt=None, model=None):
+    """Export points to file, format is detected from file extension if not given"""
+    if fmt is None:
+        fmt = getFormat(path)
+
+    if fmt == FORMAT_CSV:
+        with open(path, 'wb') as f:
+            exportCsv(gpxData, f, model)
+    elif fmt == FORMAT_NPZ:
+        with open(path, 'wb') as f:
+            exportNpz(gpxData, f, model)
+    else:
+        raise ValueError('Unsupported export format: %s' % (fmt or path))
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    DATA = ('<gpx>\n'
+            '  <trk>\n'
+            '    <trkseg>\n'
+            '      <trkpt lat="49.000" lon="16"><ele>200</ele><time>2015-02-23T10:00:00Z</time></trkpt>\n'
+            '      <trkpt lat="49.001" lon="16"><time>2015-02-23T10:00:10Z</time></trkpt>\n'
+            '    </trkseg>\n'
+            '    <trkseg>\n'
+            '      <trkpt lat="49.002" lon="16"><ele>210</ele></trkpt>\n'
+            '    </trkseg>\n'
+            '  </trk>\n'
+            '</gpx>\n')
+
+    def getGpx(self):
+        return gpx.GpxReaderXml(xml.dom.minidom.parseString(self.DATA)).gpx
+
+    def checkSegmentColumns(self):
+        segments = list(iterSegmentColumns(self.getGpx()))
+        self.assertEqual(len(segments), 2)
+        (tracks, segs, lats, lons, eles, times, dists) = segments[0]
+        self.assertEqual(tracks, [0, 0])
+        self.assertEqual(segs, [0, 0])
+        self.assertEqual(eles, [200, None])
+        self.assertEqual(times[1] - times[0], 10)
+        self.assertEqual(dists[0], 0)
+        self.assertAlmostEqual(dists[1], 111.2, 0)
+
+        # distance is cumulative over whole track
+        (tracks, segs, lats, lons, eles, times, dists) = segments[1]
+        self.assertEqual(segs, [1])
+        self.assertEqual(times, [None])
+        self.assertAlmostEqual(dists[0], segments[0][6][-1])
+
+    def checkExportCsv(self):
+        f = StringIO.StringIO()
+        exportCsv(self.getGpx(), f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0], ','.join(COLUMNS))
+        self.assertEqual(lines[1], '0,0,49.0000000,16.0000000,200.00,1424685600.000,0.00')
+        self.assertEqual(lines[2], '0,0,49.0010000,16.0000000,,1424685610.000,111.21')
+        self.assertEqual(lines[3], '0,1,49.0020000,16.0000000,210.00,,111.21')
+        return f.getvalue()
+
+    def testWithoutNumpy(self):
+        global numpy
+        savedNumpy = numpy
+        try:
+            numpy = None
+            geo.numpy = None
+            self.checkSegmentColumns()
+            output = self.checkExportCsv()
+            self.assertRaises(RuntimeError, exportNpz, self.getGpx(), StringIO.StringIO())
+            self.assertRaises(RuntimeError, list, iterSegmentColumns(self.getGpx(), asArrays=True))
+        finally:
+            numpy = savedNumpy
+            geo.numpy = savedNumpy
+        # output does not depend on numpy
+        self.assertEqual(self.checkExportCsv(), output)
+
+    def testSegmentColumns(self):
+        self.checkSegmentColumns()
+        if numpy is None:
+            return
+        segments = list(iterSegmentColumns(self.getGpx(), asArrays=True))
+        self.assertEqual(list(segments[0][0]), [0, 0])
+        self.assertTrue(numpy.isnan(segments[0][4][1]))
+        self.assertAlmostEqual(segments[1][6][0], segments[0][6][-1])
+
+    def testExportCsvChunks(self):
+        global CSV_CHUNK_SIZE
+        saved = CSV_CHUNK_SIZE
+        try:
+            CSV_CHUNK_SIZE = 1
+            output = self.checkExportCsv()
+        finally:
+            CSV_CHUNK_SIZE = saved
+        self.assertEqual(self.checkExportCsv(), output)
+
+    def testExportCsv(self):
+        self.checkExportCsv()
+
+    def testExportNpz(self):
+        f = StringIO.StringIO()
+        if numpy is None:
+            self.assertRaises(RuntimeError, exportNpz, self.getGpx(), f)
+            return
+        exportNpz(self.getGpx(), f)
+        f.seek(0)
+        data = numpy.load(f)
+        self.assertEqual(sorted(data.files), sorted(COLUMNS))
+        self.assertEqual(list(data['segment']), [0, 0, 1])
+        self.assertEqual(data['segment'].dtype, numpy.dtype('<i8'))
+        self.assertEqual(list(data['lat']), [49.0, 49.001, 49.002])
+        self.assertTrue(numpy.isnan(data['ele'][1]))
+        self.assertTrue(numpy.isnan(data['time'][2]))
+        self.assertAlmostEqual(data['distance'][2], 111.2, 1)
+
+        # empty gpx
+        f = StringIO.StringIO()
+        exportNpz(gpx.Gpx(), f)
+        f.seek(0)
+        self.assertEqual(len(numpy.load(f)['lat']), 0)
+
+    def testExportFormat(self):
+        self.assertRaises(ValueError, export, self.getGpx(), 'points.xxx')
+        self.assertEqual(getFormat('points.CSV'), FORMAT_CSV)
+        self.assertEqual(getFormat('/tmp/x.y/points.npz'), FORMAT_NPZ)
+        self.assertIsNone(getFormat('points.txt'))
+        self.assertIsNone(getFormat('points'))
+
+if __name__ == '__main__':
+    unittest.main()
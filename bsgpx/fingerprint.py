@@ -0,0 +1,304 @@
+import datetime
+import hashlib
+import struct
+import unittest
+import zlib
+import geo
+import gpx
+
+GEOHASH_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash(lat, lon, precision=6):
+    """Geohash of location, precision 6 is cell of ~1.2 x 0.6 km, 7 is ~150 x 150 m"""
+    latRange = [-90.0, 90.0]
+    lonRange = [-180.0, 180.0]
+    result = []
+    bit = 0
+    ch = 0
+    even = True
+    while len(result) < precision:
+        if even:
+            mid = (lonRange[0] + lonRange[1]) / 2
+            if lon >= mid:
+                ch = ch << 1 | 1
+                lonRange[0] = mid
+            else:
+                ch = ch << 1
+                lonRange[1] = mid
+        else:
+            mid = (latRange[0] + latRange[1]) / 2
+            if lat >= mid:
+                ch = ch << 1 | 1
+                latRange[0] = mid
+            else:
+                ch = ch << 1
+                latRange[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            result.append(GEOHASH_BASE32[ch])
+            bit = 0
+            ch = 0
+    return ''.join(result)
+
+def geohashCells(lats, lons, precision=6):
+    """
+    Geohash cells of sequence of locations, consecutive duplicates are removed.
+
+    Locations are quantized to integer cell indices first, so only points
+    entering a new cell are encoded to geohash string.
+    """
+    bits = 5 * precision
+    lonBits = (bits + 1) // 2
+    latBits = bits // 2
+    latScale = (1 << latBits) / 180.0
+    lonScale = (1 << lonBits) / 360.0
+    latMax = (1 << latBits) - 1
+    lonMax = (1 << lonBits) - 1
+
+    result = []
+    last = None
+    for lat, lon in zip(lats, lons):
+        cell = (min(int((lat + 90.0) * latScale), latMax), min(int((lon + 180.0) * lonScale), lonMax))
+        if cell == last:
+            continue
+        last = cell
+
+        # interleave bits, longitude first
+        (y, x) = cell
+        value = 0
+        for i in xrange(bits):
+            if i % 2 == 0:
+                value = value << 1 | (x >> (lonBits - 1 - i // 2)) & 1
+            else:
+                value = value << 1 | (y >> (latBits - 1 - i // 2)) & 1
+        chars = [GEOHASH_BASE32[(value >> (5 * (precision - 1 - j))) & 31] for j in xrange(precision)]
+        result.append(''.join(chars))
+    return result
+
+class TrackFingerprint:
+    """Compact fingerprint of track geometry
+
+    Track is represented by sequence of geohash cells it passes through
+    (consecutive duplicates removed), start time and length. Exact
+    duplicates share `digest`, near duplicates are looked up through
+    MinHash `signature` of set of cells.
+    """
+
+    # start time and length are rounded to these units in digest
+    TIME_UNIT = 60
+    LENGTH_UNIT = 100
+
+    def __init__(self, track, precision=6, numHashes=32, model=geo.MODEL_EQUIRECTANGULAR):
+        self.cells = []
+        length = 0.0
+        for s in track.segments:
+            length += sum(s.getDistances(geo.MODE_2D, model))
+            for cell in geohashCells([p.lat for p in s.points], [p.lon for p in s.points], precision):
+                if not self.cells or self.cells[-1] != cell:
+                    self.cells.append(cell)
+
+        self.length = length
+        self.startTime = gpx.toSeconds(track.getStartTime())
+        self.cellSet = frozenset(self.cells)
+        self.signature = minHash(self.cellSet, numHashes)
+
+        startKey = int(self.startTime // self.TIME_UNIT) if self.startTime is not None else None
+        self.digest = hashlib.sha1(repr((self.cells, startKey, int(round(self.length / self.LENGTH_UNIT))))).hexdigest()
+
+    def similarity(self, other):
+        """Jaccard similarity of sets of cells (cost is bounded by number of cells), 0 for tracks without points"""
+        if not self.cellSet or not other.cellSet:
+            return 0.0
+        return len(self.cellSet & other.cellSet) / float(len(self.cellSet | other.cellSet))
+
+def minHash(values, numHashes):
+    """MinHash signature of set of strings, empty set has signature of zeros"""
+    if not values:
+        return (0,) * numHashes
+    return tuple(min(zlib.crc32(struct.pack('>I', i) + v) & 0xffffffff for v in values) for i in xrange(numHashes))
+
+class DuplicateFinder:
+    """Finds duplicate and near duplicate tracks
+
+    Candidates are looked up by LSH (signature is split to bands, tracks
+    sharing any band bucket are candidates) and confirmed by similarity
+    of cells, length and start time.
+    """
+
+    def __init__(self, precision=6, numHashes=32, bands=8, threshold=0.7, maxLengthRatio=0.8, maxStartDiff=3600):
+        if numHashes % bands != 0:
+            raise ValueError('Number of hashes must be multiple of bands')
+        self.precision = precision
+        self.numHashes = numHashes
+        self.bands = bands
+        self.threshold = threshold
+        self.maxLengthRatio = maxLengthRatio
+        self.maxStartDiff = maxStartDiff
+
+        self.fingerprints = {}
+        self.digests = {}
+        self.buckets = {}
+
+    def add(self, key, track):
+        """Add track identified by key, returns its fingerprint
+
+        Tracks without points are not indexed, they would all share
+        the same (empty) signature.
+        """
+        fp = TrackFingerprint(track, self.precision, self.numHashes)
+        if not fp.cells:
+            return fp
+
+        self.fingerprints[key] = fp
+        self.digests.setdefault(fp.digest, []).append(key)
+
+        rows = self.numHashes // self.bands
+        for band in xrange(self.bands):
+            bucket = (band,) + fp.signature[band * rows:(band + 1) * rows]
+            self.buckets.setdefault(bucket, []).append(key)
+
+        return fp
+
+    def getDuplicates(self):
+        """Groups of keys of tracks with equal digest"""
+        return [keys for keys in self.digests.values() if len(keys) > 1]
+
+    def isNearDuplicate(self, fp1, fp2):
+        if fp1.startTime is not None and fp2.startTime is not None:
+            if abs(fp1.startTime - fp2.startTime) > self.maxStartDiff:
+                return False
+        lengths = sorted([fp1.length, fp2.length])
+        if lengths[1] > 0 and lengths[0] / lengths[1] < self.maxLengthRatio:
+            return False
+        return fp1.similarity(fp2) >= self.threshold
+
+    def getCandidates(self):
+        """
+        Pairs of keys of tracks sharing LSH bucket.
+
+        Tracks in bucket are sorted by start time and only tracks starting
+        within maxStartDiff are paired, so a route ridden every day does not
+        produce quadratic number of pairs. Tracks without time are paired
+        with all tracks of the bucket.
+        """
+        candidates = set()
+        for keys in self.buckets.values():
+            if len(keys) < 2:
+                continue
+
+            timed = sorted((self.fingerprints[key].startTime, key) for key in keys
+                if self.fingerprints[key].startTime is not None)
+            untimed = [key for key in keys if self.fingerprints[key].startTime is None]
+
+            for i, (startTime, key) in enumerate(timed):
+                for j in xrange(i + 1, len(timed)):
+                    if timed[j][0] - startTime > self.maxStartDiff:
+                        break
+                    candidates.add(tuple(sorted((key, timed[j][1]))))
+
+            for i, key in enumerate(untimed):
+                for other in untimed[i + 1:] + [k for _, k in timed]:
+                    candidates.add(tuple(sorted((key, other))))
+
+        return candidates
+
+    def getNearDuplicates(self):
+        """Pairs (key1, key2, similarity) of near duplicate tracks"""
+        result = []
+        for key1, key2 in sorted(self.getCandidates()):
+            fp1 = self.fingerprints[key1]
+            fp2 = self.fingerprints[key2]
+            if self.isNearDuplicate(fp1, fp2):
+                result.append((key1, key2, fp1.similarity(fp2)))
+        return result
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    @staticmethod
+    def createTrack(lat, lon, n=200, step=0.0005, noise=0.0, start=1424685600):
+        segment = gpx.GpxTrackSegment()
+        for i in xrange(n):
+            # deterministic jitter
+            d = noise * ((i * 7919) % 11 - 5) / 5.0
+            segment.points.append(gpx.GpxTrackPoint(lat + i * step + d, lon + i * step - d,
+                time=datetime.datetime.utcfromtimestamp(start + i * 10) if start is not None else None))
+        track = gpx.GpxTrack()
+        track.segments.append(segment)
+        return track
+
+    def testGeohash(self):
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash(57.64911, 10.40744, 5), 'u4pru')
+
+        lats = [57.64911, 57.64912, 49.1951, -33.8688, 89.99, -90]
+        lons = [10.40744, 10.40745, 16.6068, 151.2093, 179.99, -180]
+        for precision in (5, 6, 7, 11):
+            expected = [geohash(lat, lon, precision) for lat, lon in zip(lats, lons)]
+            expected = [c for i, c in enumerate(expected) if i == 0 or expected[i - 1] != c]
+            self.assertEqual(geohashCells(lats, lons, precision), expected)
+
+    def testFingerprint(self):
+        fp1 = TrackFingerprint(self.createTrack(49.0, 16.0))
+        fp2 = TrackFingerprint(self.createTrack(49.0, 16.0))
+        self.assertEqual(fp1.digest, fp2.digest)
+        self.assertEqual(fp1.signature, fp2.signature)
+        self.assertEqual(fp1.similarity(fp2), 1.0)
+        self.assertTrue(fp1.length > 10000)
+
+        fp3 = TrackFingerprint(self.createTrack(50.0, 16.0))
+        self.assertNotEqual(fp1.digest, fp3.digest)
+        self.assertEqual(fp1.similarity(fp3), 0.0)
+
+        fp = TrackFingerprint(gpx.GpxTrack())
+        self.assertEqual(fp.cells, [])
+        self.assertIsNone(fp.startTime)
+
+    def testDuplicateFinder(self):
+        finder = DuplicateFinder()
+        finder.add('a', self.createTrack(49.0, 16.0))
+        finder.add('b', self.createTrack(49.0, 16.0))
+        finder.add('c', self.createTrack(49.0, 16.0, noise=0.0002, start=1424685605))
+        finder.add('d', self.createTrack(50.0, 16.0))
+        finder.add('e', self.createTrack(49.0, 16.0, start=1424685600 + 86400))
+
+        self.assertEqual(finder.getDuplicates(), [['a', 'b']])
+        pairs = [(k1, k2) for k1, k2, _ in finder.getNearDuplicates()]
+        self.assertEqual(pairs, [('a', 'b'), ('a', 'c'), ('b', 'c')])
+
+        self.assertRaises(ValueError, DuplicateFinder, numHashes=10, bands=3)
+
+    def testEmptyTracks(self):
+        fp = TrackFingerprint(gpx.GpxTrack())
+        self.assertEqual(fp.similarity(TrackFingerprint(gpx.GpxTrack())), 0.0)
+        self.assertEqual(fp.similarity(TrackFingerprint(self.createTrack(49.0, 16.0))), 0.0)
+
+        finder = DuplicateFinder()
+        for key in ('x', 'y', 'z'):
+            finder.add(key, gpx.GpxTrack())
+        finder.add('a', self.createTrack(49.0, 16.0))
+        self.assertEqual(finder.getDuplicates(), [])
+        self.assertEqual(finder.getNearDuplicates(), [])
+        self.assertEqual(finder.buckets and max(len(keys) for keys in finder.buckets.values()), 1)
+
+    def testCandidatesTimeWindow(self):
+        # the same route ridden every day, twice on the last day
+        finder = DuplicateFinder()
+        for day in xrange(30):
+            finder.add(day, self.createTrack(49.0, 16.0, start=1424685600 + day * 86400))
+        finder.add('again', self.createTrack(49.0, 16.0, start=1424685600 + 29 * 86400 + 600))
+        finder.add('untimed', self.createTrack(49.0, 16.0, start=None))
+
+        candidates = finder.getCandidates()
+        timedPairs = [pair for pair in candidates if 'untimed' not in pair]
+        self.assertEqual(timedPairs, [(29, 'again')])
+        # track without time is compared with all tracks
+        self.assertEqual(len(candidates), 1 + 31)
+        self.assertEqual(set((k1, k2) for k1, k2, _ in finder.getNearDuplicates()),
+            set([(k, 'untimed') for k in range(30)] + [(29, 'again'), ('again', 'untimed')]))
+
+if __name__ == '__main__':
+    unittest.main()
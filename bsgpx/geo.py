@@ -2,8 +2,10 @@
 import math
 import unittest
 
-# One degree in meters:
-ONE_DEGREE = 1000. * 10000.8 / 90.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 # Earth radius in meters 
 EARTH_RADIUS = 6371.8 * 1000
@@ -11,30 +13,43 @@ EARTH_RADIUS = 6371.8 * 1000
 MODE_2D = 0
 MODE_3D = 1
 
+# speed (m/s) under which point is considered as stopped (~1 km/h)
+STOPPED_SPEED_THRESHOLD = 0.3
+
+# percentile of speeds taken as max speed (filters GPS jitter spikes)
+MAX_SPEED_PERCENTILE = 95
+
+# WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+
+# distance models
+MODEL_EQUIRECTANGULAR = 'equirectangular'
+MODEL_HAVERSINE = 'haversine'
+MODEL_VINCENTY = 'vincenty'
+
 def to_rad(x):
     return x / 180.0 * math.pi
 
-def length(locations=None, mode=MODE_2D):
-    if locations is None:
+def length(locations=None, mode=MODE_2D, model=None):
+    if locations is None or len(locations) < 2:
         return 0
-    #harversine
-
-    length = 0
-    lastLoc = None
-    for i in xrange(len(locations)):
-        if lastLoc is not None:
-            if mode == MODE_3D:
-                d = locations[i].distance3d(lastLoc)
-            else:
-                d = locations[i].distance2d(lastLoc)
-            length += d
-        lastLoc = locations[i]
-    return length
+
+    lats = [l.lat for l in locations]
+    lons = [l.lon for l in locations]
+    eles = [l.ele for l in locations] if mode == MODE_3D else None
+
+    return sum(distances(lats, lons, eles, model))
 
 def distanceHarversine(lat1, lon1, lat2, lon2):
     """
     Haversine distance between two points.
 
+    Earth is modelled as a sphere of radius EARTH_RADIUS, so the error
+    against WGS-84 ellipsoid is up to ~0.5% depending on latitude and
+    direction (~0.1-0.3% in mid latitudes). Use Vincenty model where
+    this matters.
+
     Implemented from http://www.movable-type.co.uk/scripts/latlong.html
     """
     d_lat = to_rad(lat1 - lat2)
@@ -49,22 +64,247 @@ def distanceHarversine(lat1, lon1, lat2, lon2):
 
     return d
 
-def distance(lat1, lon1, ele1, lat2, lon2, ele2):
+def distanceEquirectangular(lat1, lon1, lat2, lon2):
+    """
+    Equirectangular (flat earth) approximation of distance between two points.
+
+    Longitude difference is scaled by cosine of the mean latitude. Relative
+    error against haversine is well under 0.1% for points closer than ~10 km
+    outside of polar regions, which covers consecutive points of any
+    regularly sampled track. Not suitable for long distances.
     """
-    Distance between two points. If elevation is None compute a 2d distance
+    x = to_rad(lon1 - lon2) * math.cos(to_rad(lat1 + lat2) / 2)
+    y = to_rad(lat1 - lat2)
+
+    return EARTH_RADIUS * math.sqrt(x * x + y * y)
 
+def distanceVincenty(lat1, lon1, lat2, lon2):
     """
+    Vincenty (inverse) distance between two points on the WGS-84 ellipsoid.
+
+    Accurate to ~0.5 mm. The iteration does not converge for nearly
+    antipodal points; haversine distance is returned in such case.
+
+    Implemented from http://www.movable-type.co.uk/scripts/latlong-vincenty.html
+    """
+    a = WGS84_A
+    f = WGS84_F
+    b = (1 - f) * a
+
+    L = to_rad(lon2 - lon1)
+    U1 = math.atan((1 - f) * math.tan(to_rad(lat1)))
+    U2 = math.atan((1 - f) * math.tan(to_rad(lat2)))
+    sinU1 = math.sin(U1)
+    cosU1 = math.cos(U1)
+    sinU2 = math.sin(U2)
+    cosU2 = math.cos(U2)
+
+    lmbd = L
+    for i in xrange(100):
+        sinLmbd = math.sin(lmbd)
+        cosLmbd = math.cos(lmbd)
+        sinSigma = math.sqrt((cosU2 * sinLmbd) ** 2 +
+            (cosU1 * sinU2 - sinU1 * cosU2 * cosLmbd) ** 2)
+        if sinSigma == 0:
+            # coincident points
+            return 0.0
+        cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLmbd
+        sigma = math.atan2(sinSigma, cosSigma)
+        sinAlpha = cosU1 * cosU2 * sinLmbd / sinSigma
+        cosSqAlpha = 1 - sinAlpha * sinAlpha
+        # equatorial line has cosSqAlpha == 0
+        cos2SigmaM = cosSigma - 2 * sinU1 * sinU2 / cosSqAlpha if cosSqAlpha != 0 else 0
+        C = f / 16 * cosSqAlpha * (4 + f * (4 - 3 * cosSqAlpha))
+        lmbdPrev = lmbd
+        lmbd = L + (1 - C) * f * sinAlpha * (sigma + C * sinSigma *
+            (cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)))
+        if abs(lmbd - lmbdPrev) < 1e-12:
+            break
+    else:
+        return distanceHarversine(lat1, lon1, lat2, lon2)
+
+    uSq = cosSqAlpha * (a * a - b * b) / (b * b)
+    A = 1 + uSq / 16384 * (4096 + uSq * (-768 + uSq * (320 - 175 * uSq)))
+    B = uSq / 1024 * (256 + uSq * (-128 + uSq * (74 - 47 * uSq)))
+    deltaSigma = B * sinSigma * (cos2SigmaM + B / 4 * (cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM) -
+        B / 6 * cos2SigmaM * (-3 + 4 * sinSigma * sinSigma) * (-3 + 4 * cos2SigmaM * cos2SigmaM)))
+
+    return b * A * (sigma - deltaSigma)
+
+def _distancesEquirectangular(lats, lons):
+    """Distances between consecutive points, equirectangular model"""
+    if numpy is not None:
+        rLats = numpy.radians(numpy.asarray(lats, dtype=float))
+        rLons = numpy.radians(numpy.asarray(lons, dtype=float))
+        x = numpy.diff(rLons) * numpy.cos((rLats[1:] + rLats[:-1]) / 2)
+        y = numpy.diff(rLats)
+        return EARTH_RADIUS * numpy.hypot(x, y)
+
+    rLats = [to_rad(lat) for lat in lats]
+    rLons = [to_rad(lon) for lon in lons]
+
+    dLats = [b - a for a, b in zip(rLats, rLats[1:])]
+    dLons = [b - a for a, b in zip(rLons, rLons[1:])]
+    coefs = [math.cos((a + b) / 2) for a, b in zip(rLats, rLats[1:])]
+
+    return [EARTH_RADIUS * math.sqrt(y * y + (x * c) ** 2) for y, x, c in zip(dLats, dLons, coefs)]
+
+def _distancesHarversine(lats, lons):
+    """Distances between consecutive points, haversine model"""
+    if numpy is not None:
+        rLats = numpy.radians(numpy.asarray(lats, dtype=float))
+        rLons = numpy.radians(numpy.asarray(lons, dtype=float))
+        cosLats = numpy.cos(rLats)
+        a = numpy.sin(numpy.diff(rLats) / 2) ** 2 + \
+            numpy.sin(numpy.diff(rLons) / 2) ** 2 * cosLats[1:] * cosLats[:-1]
+        return 2 * EARTH_RADIUS * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+
+    rLats = [to_rad(lat) for lat in lats]
+    rLons = [to_rad(lon) for lon in lons]
+    cosLats = [math.cos(lat) for lat in rLats]
+
+    result = []
+    for dLat, dLon, cc in zip([b - a for a, b in zip(rLats, rLats[1:])],
+            [b - a for a, b in zip(rLons, rLons[1:])],
+            [a * b for a, b in zip(cosLats, cosLats[1:])]):
+        a = math.sin(dLat / 2) ** 2 + math.sin(dLon / 2) ** 2 * cc
+        result.append(2 * EARTH_RADIUS * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+    return result
+
+def _distancesVincenty(lats, lons):
+    """Distances between consecutive points, Vincenty model"""
+    if numpy is None:
+        return [distanceVincenty(lat1, lon1, lat2, lon2)
+            for lat1, lon1, lat2, lon2 in zip(lats, lons, lats[1:], lons[1:])]
+
+    a = WGS84_A
+    f = WGS84_F
+    b = (1 - f) * a
+
+    rLats = numpy.radians(numpy.asarray(lats, dtype=float))
+    rLons = numpy.radians(numpy.asarray(lons, dtype=float))
+    L = numpy.diff(rLons)
+    U = numpy.arctan((1 - f) * numpy.tan(rLats))
+    sinU = numpy.sin(U)
+    cosU = numpy.cos(U)
+    sinU1 = sinU[:-1]
+    cosU1 = cosU[:-1]
+    sinU2 = sinU[1:]
+    cosU2 = cosU[1:]
+
+    # all intervals are iterated together until every one converges
+    lmbd = L
+    converged = numpy.zeros(len(L), dtype=bool)
+    for i in xrange(100):
+        sinLmbd = numpy.sin(lmbd)
+        cosLmbd = numpy.cos(lmbd)
+        sinSigma = numpy.sqrt((cosU2 * sinLmbd) ** 2 + (cosU1 * sinU2 - sinU1 * cosU2 * cosLmbd) ** 2)
+        # coincident points have zero distance, avoid division by zero
+        coincident = sinSigma == 0
+        sinSigmaSafe = numpy.where(coincident, 1.0, sinSigma)
+        cosSigma = sinU1 * sinU2 + cosU1 * cosU2 * cosLmbd
+        sigma = numpy.arctan2(sinSigma, cosSigma)
+        sinAlpha = cosU1 * cosU2 * sinLmbd / sinSigmaSafe
+        cosSqAlpha = 1 - sinAlpha * sinAlpha
+        # equatorial line has cosSqAlpha == 0
+        equatorial = cosSqAlpha == 0
+        cos2SigmaM = numpy.where(equatorial, 0.0,
+            cosSigma - 2 * sinU1 * sinU2 / numpy.where(equatorial, 1.0, cosSqAlpha))
+        C = f / 16 * cosSqAlpha * (4 + f * (4 - 3 * cosSqAlpha))
+        lmbdPrev = lmbd
+        lmbd = L + (1 - C) * f * sinAlpha * (sigma + C * sinSigma *
+            (cos2SigmaM + C * cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM)))
+        converged = numpy.abs(lmbd - lmbdPrev) < 1e-12
+        if converged.all():
+            break
+
+    uSq = cosSqAlpha * (a * a - b * b) / (b * b)
+    A = 1 + uSq / 16384 * (4096 + uSq * (-768 + uSq * (320 - 175 * uSq)))
+    B = uSq / 1024 * (256 + uSq * (-128 + uSq * (74 - 47 * uSq)))
+    deltaSigma = B * sinSigma * (cos2SigmaM + B / 4 * (cosSigma * (-1 + 2 * cos2SigmaM * cos2SigmaM) -
+        B / 6 * cos2SigmaM * (-3 + 4 * sinSigma * sinSigma) * (-3 + 4 * cos2SigmaM * cos2SigmaM)))
+
+    result = numpy.where(coincident, 0.0, b * A * (sigma - deltaSigma))
+
+    # nearly antipodal points do not converge, haversine distance is used
+    if not converged.all():
+        fallback = _distancesHarversine(lats, lons)
+        result = numpy.where(converged | coincident, result, fallback)
+
+    return result
+
+# distance models: (distance of two points, distances of consecutive points)
+DISTANCE_MODELS = {
+    MODEL_EQUIRECTANGULAR: (distanceEquirectangular, _distancesEquirectangular),
+    MODEL_HAVERSINE: (distanceHarversine, _distancesHarversine),
+    MODEL_VINCENTY: (distanceVincenty, _distancesVincenty),
+}
+
+_defaultModel = MODEL_HAVERSINE
+
+def getDistanceModel():
+    return _defaultModel
+
+def setDistanceModel(model):
+    """Set distance model used when no model is passed explicitly"""
+    global _defaultModel
+    if model not in DISTANCE_MODELS:
+        raise ValueError('Unknown distance model: %s' % model)
+    _defaultModel = model
+
+def _getModel(model):
+    if model is None:
+        model = _defaultModel
+    if model not in DISTANCE_MODELS:
+        raise ValueError('Unknown distance model: %s' % model)
+    return DISTANCE_MODELS[model]
+
+def distance2d(lat1, lon1, lat2, lon2, model=None):
+    """Distance between two points computed by given (or default) model"""
+    return _getModel(model)[0](lat1, lon1, lat2, lon2)
+
+def distances(lats, lons, eles=None, model=None, asArray=False):
+    """
+    Distances between consecutive points given as columns of coordinates.
+
+    Whole columns are processed in one pass per model, no per-point objects
+    are created. The pass is vectorized when numpy is available, list is
+    returned unless asArray is set (numpy array is returned then, numpy is
+    required). If elevations are given, 3d distances are returned (missing
+    elevations are treated as zero elevation difference).
+    """
+    if asArray and numpy is None:
+        raise RuntimeError('numpy is required for array output')
+
+    if len(lats) < 2:
+        return numpy.zeros(0) if asArray else []
+
+    result = _getModel(model)[1](lats, lons)
+
+    if numpy is not None:
+        if eles is not None:
+            dEles = numpy.diff(numpy.array(eles, dtype=float))
+            dEles[numpy.isnan(dEles)] = 0
+            result = numpy.hypot(result, dEles)
+        return result if asArray else result.tolist()
+
+    if eles is not None:
+        dEles = [b - a if a is not None and b is not None else 0 for a, b in zip(eles, eles[1:])]
+        result = [math.sqrt(d * d + e * e) if e else d for d, e in zip(result, dEles)]
 
-    coef = math.cos(lat1 / 180.0 * math.pi)
-    x = lat1 - lat2
-    y = (lon1 - lon2) * coef
+    return result
 
-    distance2d = math.sqrt(x * x + y * y) * ONE_DEGREE
+def distance(lat1, lon1, ele1, lat2, lon2, ele2, model=None):
+    """
+    Distance between two points computed by given (or default) model. If
+    elevation is None compute a 2d distance
+    """
+    d = distance2d(lat1, lon1, lat2, lon2, model)
 
     if ele1 is None or ele2 is None or ele1 == ele2:
-        return distance2d
+        return d
 
-    return math.sqrt(distance2d ** 2 + (ele1 - ele2) ** 2)
+    return math.sqrt(d ** 2 + (ele1 - ele2) ** 2)
 
 def smoothElevationData(elevations):
     result = []
@@ -109,6 +349,161 @@ def getUpDownHill(elevations, smooth=True):
 
     return (upHill, downHill)
 
+def getTimedIntervals(times, dists):
+    """
+    Intervals between consecutive points with valid time.
+
+    Times are given in seconds (None for missing timestamp), dists are
+    distances between consecutive points (see `distances`). Points without
+    time or with time not increasing against previous timed point (GPS
+    jitter, duplicated timestamps) are bridged, distance is summed from
+    previous to next timed point.
+
+    Returns columns (ixs, dts, ds), ix is index of distance (interval)
+    which ends in the timed point, dt is its duration and d its length.
+    Columns are numpy arrays if numpy is available, lists otherwise.
+    """
+    if numpy is not None:
+        if len(times) < 2:
+            return (numpy.zeros(0, dtype=int), numpy.zeros(0), numpy.zeros(0))
+
+        # missing times are -inf, so they never extend running max of time
+        ts = numpy.array(times, dtype=float)
+        ts[numpy.isnan(ts)] = -numpy.inf
+
+        # last valid time before each point, carried forward over gaps
+        lastTimes = numpy.empty(len(ts))
+        lastTimes[0] = -numpy.inf
+        numpy.maximum.accumulate(ts[:-1], out=lastTimes[1:])
+
+        valid = numpy.isfinite(ts)
+        ends = numpy.nonzero(valid & numpy.isfinite(lastTimes) & (ts > lastTimes))[0]
+        if len(ends) == 0:
+            return (numpy.zeros(0, dtype=int), numpy.zeros(0), numpy.zeros(0))
+
+        # first interval starts in first timed point, others in end of previous
+        starts = numpy.empty(len(ends), dtype=int)
+        starts[0] = numpy.argmax(valid)
+        starts[1:] = ends[:-1]
+
+        cumDists = numpy.zeros(len(ts))
+        numpy.cumsum(numpy.asarray(dists, dtype=float), out=cumDists[1:])
+
+        return (ends - 1, ts[ends] - lastTimes[ends], cumDists[ends] - cumDists[starts])
+
+    ixs = []
+    dts = []
+    ds = []
+    lastTime = None
+    d = 0.0
+    for ix, (t, dist) in enumerate(zip(times[1:], dists)):
+        if lastTime is None:
+            lastTime = times[ix]
+            d = 0.0
+        d += dist
+        if t is None or lastTime is None or t <= lastTime:
+            continue
+        ixs.append(ix)
+        dts.append(t - lastTime)
+        ds.append(d)
+        lastTime = t
+        d = 0.0
+    return (ixs, dts, ds)
+
+def joinIntervals(intervalsList):
+    """Join columns of timed intervals (see `getTimedIntervals`) of several segments"""
+    if numpy is not None:
+        if not intervalsList:
+            return (numpy.zeros(0, dtype=int), numpy.zeros(0), numpy.zeros(0))
+        return tuple(numpy.concatenate(columns) for columns in zip(*intervalsList))
+
+    result = ([], [], [])
+    for intervals in intervalsList:
+        for column, values in zip(result, intervals):
+            column.extend(values)
+    return result
+
+def getSpeeds(times, dists):
+    """
+    Speeds (m/s) of intervals between consecutive points.
+
+    Speed of interval ending in point without valid time is None, gaps are
+    bridged as described in `getTimedIntervals`.
+    """
+    (ixs, dts, ds) = getTimedIntervals(times, dists)
+    if numpy is not None:
+        (ixs, speeds) = (ixs.tolist(), (ds / dts).tolist())
+    else:
+        speeds = [d / dt for dt, d in zip(dts, ds)]
+
+    result = [None] * len(dists)
+    for ix, v in zip(ixs, speeds):
+        result[ix] = v
+    return result
+
+def getIntervalsMovingData(intervals, speedThreshold=STOPPED_SPEED_THRESHOLD, maxSpeedPercentile=MAX_SPEED_PERCENTILE):
+    """
+    Moving statistics of timed intervals (see `getTimedIntervals`).
+
+    Returns tuple (movingTime, stoppedTime, movingDistance, stoppedDistance,
+    maxSpeed). Intervals slower than speedThreshold (m/s) are counted as
+    stopped. To suppress GPS jitter spikes the max speed is taken at given
+    percentile of moving interval speeds instead of the absolute maximum.
+    """
+    (_, dts, ds) = intervals
+
+    if numpy is not None:
+        dts = numpy.asarray(dts, dtype=float)
+        ds = numpy.asarray(ds, dtype=float)
+        speeds = ds / dts if len(dts) else numpy.zeros(0)
+        moving = speeds >= speedThreshold
+        stopped = ~moving
+        result = (float(dts[moving].sum()), float(dts[stopped].sum()),
+            float(ds[moving].sum()), float(ds[stopped].sum()))
+        movingSpeeds = numpy.sort(speeds[moving]).tolist()
+    else:
+        movingTime = 0.0
+        stoppedTime = 0.0
+        movingDistance = 0.0
+        stoppedDistance = 0.0
+        movingSpeeds = []
+
+        for dt, d in zip(dts, ds):
+            v = d / dt
+            if v >= speedThreshold:
+                movingTime += dt
+                movingDistance += d
+                movingSpeeds.append(v)
+            else:
+                stoppedTime += dt
+                stoppedDistance += d
+
+        movingSpeeds.sort()
+        result = (movingTime, stoppedTime, movingDistance, stoppedDistance)
+
+    maxSpeed = None
+    if movingSpeeds:
+        ix = int(math.ceil(len(movingSpeeds) * maxSpeedPercentile / 100.0)) - 1
+        maxSpeed = movingSpeeds[min(max(ix, 0), len(movingSpeeds) - 1)]
+
+    return result + (maxSpeed,)
+
+def getMovingData(times, dists, speedThreshold=STOPPED_SPEED_THRESHOLD, maxSpeedPercentile=MAX_SPEED_PERCENTILE):
+    """Moving statistics of consecutive points, see `getIntervalsMovingData`"""
+    return getIntervalsMovingData(getTimedIntervals(times, dists), speedThreshold, maxSpeedPercentile)
+
+def getAverageSpeed(distance, time):
+    """Average speed (m/s), None if time is zero"""
+    if not time:
+        return None
+    return distance / time
+
+def getPace(distance, time):
+    """Pace (seconds per kilometer), None if distance is zero"""
+    if not distance:
+        return None
+    return time / (distance / 1000.0)
+
 class Location:
     """ Generic geographical location """
 
@@ -122,18 +517,17 @@ class Location:
         self.ele = elevation
 
 
-    def distance2d(self, location):
+    def distance2d(self, location, model=None):
         if not location:
             return None
 
-        #return distance(self.lat, self.lon, None, location.lat, location.lon, None)
-        return distanceHarversine(self.lat, self.lon, location.lat, location.lon)
+        return distance2d(self.lat, self.lon, location.lat, location.lon, model)
 
-    def distance3d(self, location):
+    def distance3d(self, location, model=None):
         if not location:
             return None
 
-        return distance(self.lat, self.lon, self.ele, location.lat, location.lon, location.ele)
+        return distance(self.lat, self.lon, self.ele, location.lat, location.lon, location.ele, model)
 
     def __str__(self):
         return '[loc:%s,%s@%s]' % (self.lat, self.lon, self.ele)
@@ -154,6 +548,67 @@ class UnitTests(unittest.TestCase):
         l2 = Location(1, 0)
         l = length([l1, l2])
 
+    def testDistanceModels(self):
+        # Brno - Prague
+        for model in DISTANCE_MODELS:
+            d = distance2d(49.1951, 16.6068, 50.0755, 14.4378, model)
+            self.assertTrue(abs(d - 185000) < 1500, '%s: %s' % (model, d))
+
+        # short distance - all models agree
+        dh = distance2d(49.1990, 16.5280, 49.1991, 16.5282, MODEL_HAVERSINE)
+        de = distance2d(49.1990, 16.5280, 49.1991, 16.5282, MODEL_EQUIRECTANGULAR)
+        dv = distance2d(49.1990, 16.5280, 49.1991, 16.5282, MODEL_VINCENTY)
+        self.assertAlmostEqual(dh, de, 3)
+        self.assertTrue(abs(dh - dv) / dh < 0.005)
+
+        self.assertEqual(distanceVincenty(10, 10, 10, 10), 0)
+        self.assertEqual(distance(49.1990, 16.5280, None, 49.1991, 16.5282, 100, MODEL_VINCENTY), dv)
+        self.assertAlmostEqual(distance(49.1990, 16.5280, 0, 49.1991, 16.5282, 10, MODEL_HAVERSINE) ** 2, dh ** 2 + 100, 6)
+        self.assertRaises(ValueError, distance2d, 0, 0, 1, 1, 'xxx')
+        self.assertRaises(ValueError, setDistanceModel, 'xxx')
+
+    def checkDistances(self):
+        # includes coincident points and nearly antipodal points (Vincenty does not converge)
+        lats = [49.1990, 49.1991, 49.1995, 49.2000, 49.2000, 0, 0.5, -0.5, 0, 0.1]
+        lons = [16.5280, 16.5282, 16.5290, 16.5291, 16.5291, 0, 179.7, 0, 0, 179.5]
+        for model in DISTANCE_MODELS:
+            ds = distances(lats, lons, model=model)
+            self.assertTrue(isinstance(ds, list))
+            self.assertEqual(len(ds), 9)
+            for i, d in enumerate(ds):
+                self.assertAlmostEqual(d, distance2d(lats[i], lons[i], lats[i + 1], lons[i + 1], model), 6)
+
+        ds = distances(lats, lons, [100, 110, None, 100, 100, 0, 0, 0, 0, 0], MODEL_EQUIRECTANGULAR)
+        self.assertTrue(ds[0] > distance2d(lats[0], lons[0], lats[1], lons[1], MODEL_EQUIRECTANGULAR))
+        self.assertAlmostEqual(ds[2], distance2d(lats[2], lons[2], lats[3], lons[3], MODEL_EQUIRECTANGULAR), 6)
+        self.assertEqual(distances([1], [1]), [])
+
+    def testDistances(self):
+        global numpy
+        self.checkDistances()
+        if numpy is None:
+            self.assertRaises(RuntimeError, distances, [1, 2], [1, 2], asArray=True)
+            return
+        self.assertEqual(len(distances([1, 2], [1, 2], asArray=True)), 1)
+        savedNumpy = numpy
+        try:
+            numpy = None
+            self.checkDistances()
+        finally:
+            numpy = savedNumpy
+
+    def testDefaultModel(self):
+        l1 = Location(49.1990, 16.5280)
+        l2 = Location(49.2990, 16.6280)
+        self.assertEqual(getDistanceModel(), MODEL_HAVERSINE)
+        try:
+            setDistanceModel(MODEL_EQUIRECTANGULAR)
+            self.assertEqual(l1.distance2d(l2), distanceEquirectangular(l1.lat, l1.lon, l2.lat, l2.lon))
+            self.assertAlmostEqual(length([l1, l2]), l1.distance2d(l2), 6)
+        finally:
+            setDistanceModel(MODEL_HAVERSINE)
+        self.assertEqual(l1.distance2d(l2), distanceHarversine(l1.lat, l1.lon, l2.lat, l2.lon))
+
     def testGeoUtilsElevations(self):
         (up, down) = getUpDownHill([100])
         self.assertEquals(up, 0)
@@ -166,7 +621,78 @@ class UnitTests(unittest.TestCase):
         (up, down) = getUpDownHill([200, 100, 10, 80, 50], False)
         self.assertEquals(up, 70)
         self.assertEquals(down, 220)
-        
+
+    def checkSpeeds(self):
+        # missing and duplicated times are bridged
+        speeds = getSpeeds([0, 10, None, 30, 30, 40], [100, 50, 50, 10, 20])
+        self.assertEqual(speeds, [10, None, 5, None, 3])
+
+        # leading points without time have no speed
+        self.assertEqual(getSpeeds([None, 0, 10], [5, 20]), [None, 2])
+        (ixs, dts, ds) = getTimedIntervals([None, 0, 10], [5, 20])
+        self.assertEqual((list(ixs), list(dts), list(ds)), ([1], [10], [20]))
+
+        # time going back is bridged up to point after the latest time
+        self.assertEqual(getSpeeds([0, 10, 5, 8, 20, None], [10, 10, 10, 10, 10]), [1, None, None, 3, None])
+        self.assertEqual(getSpeeds([None, None], [5]), [None])
+        self.assertEqual(getSpeeds([0], []), [])
+
+        (ixs, dts, ds) = joinIntervals([getTimedIntervals([0, 10], [5]), getTimedIntervals([0, 5, 10], [1, 2])])
+        self.assertEqual((list(ixs), list(dts), list(ds)), ([0, 0, 1], [10, 5, 5], [5, 1, 2]))
+        self.assertEqual([len(c) for c in joinIntervals([])], [0, 0, 0])
+
+    def checkMovingData(self):
+        times = [0, 10, 20, None, 40, 50, 60]
+        dists = [100, 1, 100, 100, 50, 200]
+        (movingTime, stoppedTime, movingDist, stoppedDist, maxSpeed) = getMovingData(times, dists, 1.0, 100)
+        self.assertEqual(movingTime, 50)
+        self.assertEqual(stoppedTime, 10)
+        self.assertEqual(movingDist, 550)
+        self.assertEqual(stoppedDist, 1)
+        self.assertEqual(maxSpeed, 20)
+
+        (_, _, _, _, maxSpeed) = getMovingData(times, dists, 1.0, 50)
+        self.assertEqual(maxSpeed, 10)
+
+        self.assertEqual(getPace(2000, 600), 300)
+        self.assertIsNone(getPace(0, 600))
+        self.assertEqual(getAverageSpeed(2000, 400), 5)
+        self.assertIsNone(getAverageSpeed(2000, 0))
+
+        (movingTime, stoppedTime, movingDist, stoppedDist, maxSpeed) = getMovingData([], [])
+        self.assertEqual(movingTime, 0)
+        self.assertIsNone(maxSpeed)
+
+    def testSpeeds(self):
+        global numpy
+        self.checkSpeeds()
+        savedNumpy = numpy
+        try:
+            numpy = None
+            self.checkSpeeds()
+        finally:
+            numpy = savedNumpy
+
+    def testMovingData(self):
+        global numpy
+        self.checkMovingData()
+        savedNumpy = numpy
+        try:
+            numpy = None
+            self.checkMovingData()
+        finally:
+            numpy = savedNumpy
+
+        # both paths agree on irregular data
+        times = [None, 0, 3, 3, None, 9, 7, 12, 30, None, 31, 40]
+        dists = [5, 10, 0.5, 7, 8, 2, 6, 1, 0.1, 20, 30]
+        expected = getMovingData(times, dists, 0.5, 80)
+        try:
+            numpy = None
+            self.assertEqual(getMovingData(times, dists, 0.5, 80), expected)
+        finally:
+            numpy = savedNumpy
+
 if __name__ == '__main__':
     unittest.main()
 
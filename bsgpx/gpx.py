@@ -5,6 +5,14 @@ import unittest
 import xml.dom.minidom
 import geo
 
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def toSeconds(time):
+    """Convert (naive UTC) datetime to seconds since epoch"""
+    if time is None:
+        return None
+    return (time - EPOCH).total_seconds()
+
 class GpxTrackPoint(geo.Location):
     def __init__(self, latitude=0, longitude=0, elevation=None, time=None, symbol=None, comment=None,
             horizontal_dilution=None, vertical_dilution=None, position_dilution=None, speed=None,
@@ -17,7 +25,25 @@ class GpxTrackPoint(geo.Location):
         self.comment = comment
         self.name = name
 
-class GpxTrackSegment:
+class GpxMovingData:
+    """Average moving speed and pace derived from `getMovingData` of subclass
+
+    Both are computed from data returned by single `getMovingData` call,
+    use `geo.getAverageSpeed` and `geo.getPace` if moving data is
+    needed as well.
+    """
+
+    def getAverageSpeed(self, speedThreshold=geo.STOPPED_SPEED_THRESHOLD, model=None):
+        """Average moving speed (m/s), None if there is no moving data"""
+        (movingTime, _, movingDistance, _, _) = self.getMovingData(speedThreshold, model)
+        return geo.getAverageSpeed(movingDistance, movingTime)
+
+    def getAveragePace(self, speedThreshold=geo.STOPPED_SPEED_THRESHOLD, model=None):
+        """Average moving pace (s/km), None if there is no moving data"""
+        (movingTime, _, movingDistance, _, _) = self.getMovingData(speedThreshold, model)
+        return geo.getPace(movingDistance, movingTime)
+
+class GpxTrackSegment(GpxMovingData):
     def __init__(self, points=None):
         self.points = points if points else []
 
@@ -33,7 +59,40 @@ class GpxTrackSegment:
 
         return result
 
-class GpxTrack:
+    def getTimes(self):
+        """Point times as seconds since epoch (None for points without time)"""
+        epoch = EPOCH
+        return [None if p.time is None else (p.time - epoch).total_seconds() for p in self.points]
+
+    def getDistances(self, mode=geo.MODE_2D, model=None):
+        """Distances between consecutive points"""
+        lats = [p.lat for p in self.points]
+        lons = [p.lon for p in self.points]
+        eles = [p.ele for p in self.points] if mode == geo.MODE_3D else None
+        return geo.distances(lats, lons, eles, model)
+
+    def getDuration(self):
+        """Time (seconds) between first and last point with time"""
+        times = [t for t in self.getTimes() if t is not None]
+        if len(times) < 2:
+            return 0
+        return max(times[-1] - times[0], 0)
+
+    def getSpeeds(self, model=None):
+        """Speed (m/s) in each point, None for first point and points without valid time"""
+        if not self.points:
+            return []
+        return [None] + geo.getSpeeds(self.getTimes(), self.getDistances(geo.MODE_2D, model))
+
+    def getTimedIntervals(self, model=None):
+        """Intervals between points with valid time, see `geo.getTimedIntervals`"""
+        return geo.getTimedIntervals(self.getTimes(), self.getDistances(geo.MODE_2D, model))
+
+    def getMovingData(self, speedThreshold=geo.STOPPED_SPEED_THRESHOLD, model=None, maxSpeedPercentile=geo.MAX_SPEED_PERCENTILE):
+        """Returns (movingTime, stoppedTime, movingDistance, stoppedDistance, maxSpeed)"""
+        return geo.getIntervalsMovingData(self.getTimedIntervals(model), speedThreshold, maxSpeedPercentile)
+
+class GpxTrack(GpxMovingData):
     def __init__(self, name=None, description=None, number=None):
         self.name = name
         self.description = description
@@ -58,6 +117,28 @@ class GpxTrack:
             result += segment.getDuration()
         return result
 
+    def getStartTime(self):
+        """Time of first point with time, None if there is no such point"""
+        for s in self.segments:
+            for p in s.points:
+                if p.time is not None:
+                    return p.time
+        return None
+
+    def getBounds(self):
+        """Returns (minLat, maxLat, minLon, maxLon), items are None for track without points"""
+        lats = [p.lat for s in self.segments for p in s.points]
+        lons = [p.lon for s in self.segments for p in s.points]
+        if not lats:
+            return (None, None, None, None)
+        return (min(lats), max(lats), min(lons), max(lons))
+
+    def getMovingData(self, speedThreshold=geo.STOPPED_SPEED_THRESHOLD, model=None, maxSpeedPercentile=geo.MAX_SPEED_PERCENTILE):
+        """Returns (movingTime, stoppedTime, movingDistance, stoppedDistance, maxSpeed)"""
+        # intervals are not bridged across segments, max speed percentile is computed over all of them
+        intervals = geo.joinIntervals([s.getTimedIntervals(model) for s in self.segments])
+        return geo.getIntervalsMovingData(intervals, speedThreshold, maxSpeedPercentile)
+
     def getUpDownHill(self, smooth=True):
 
         # default
@@ -137,8 +218,9 @@ class GpxReaderXml(GpxReader):
         m = re.match(r'^(\d\d\d\d)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(\.\d+)?Z$', val)
         if m is None:
             raise ValueError('Invalid datetime: %s' % val)
-        miliSeconds = int(m.group(7)[1:]) if m.group(7) is not None else 0
-        result = datetime.datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), int(m.group(6)), miliSeconds)
+        # fraction of second, rounded to microseconds
+        microSeconds = min(int(round(float(m.group(7)) * 1e6)), 999999) if m.group(7) is not None else 0
+        result = datetime.datetime(int(m.group(1)), int(m.group(2)), int(m.group(3)), int(m.group(4)), int(m.group(5)), int(m.group(6)), microSeconds)
         return result
 
     @staticmethod
@@ -422,7 +504,12 @@ class UnitTests(unittest.TestCase):
 
     def testReaderXml(self):
         t = GpxReaderXml.parseTime('2015-02-23T19:22:18.061Z')
+        self.assertEqual(t, datetime.datetime(2015, 2, 23, 19, 22, 18, 61000))
         t = GpxReaderXml.parseTime('2015-02-23T19:22:18Z')
+        self.assertEqual(t, datetime.datetime(2015, 2, 23, 19, 22, 18))
+        self.assertEqual(GpxReaderXml.parseTime('2015-02-23T19:22:18.5Z').microsecond, 500000)
+        self.assertEqual(GpxReaderXml.parseTime('2015-02-23T19:22:18.0000015Z').microsecond, 2)
+        self.assertEqual(GpxReaderXml.parseTime('2015-02-23T19:22:18.9999999Z').microsecond, 999999)
 
     def testReaderXmlGpx(self):
         data = ('<gpx>\n'
@@ -487,6 +574,75 @@ class UnitTests(unittest.TestCase):
         self.assertEquals(tp1.lat, 1)
         self.assertEquals(tp1.lon, 2)
 
+    def testSegmentAnalytics(self):
+        data = ('<gpx>\n'
+                '  <trk>\n'
+                '    <trkseg>\n'
+                '      <trkpt lat="49.0000" lon="16"><time>2015-02-23T10:00:00Z</time></trkpt>\n'
+                '      <trkpt lat="49.0010" lon="16"><time>2015-02-23T10:00:10Z</time></trkpt>\n'
+                '      <trkpt lat="49.0010" lon="16"><time>2015-02-23T10:01:10Z</time></trkpt>\n'
+                '      <trkpt lat="49.0020" lon="16"></trkpt>\n'
+                '      <trkpt lat="49.0030" lon="16"><time>2015-02-23T10:01:30Z</time></trkpt>\n'
+                '    </trkseg>\n'
+                '  </trk>\n'
+                '</gpx>\n')
+
+        reader = GpxReaderXml(xml.dom.minidom.parseString(data))
+        track = reader.gpx.tracks[0]
+        segment = track.segments[0]
+
+        self.assertEquals(segment.getDuration(), 90)
+        self.assertEquals(track.getDuration(), 90)
+
+        speeds = segment.getSpeeds()
+        self.assertEquals(len(speeds), 5)
+        self.assertIsNone(speeds[0])
+        self.assertAlmostEqual(speeds[1], 11.1, 1)
+        self.assertEquals(speeds[2], 0)
+        self.assertIsNone(speeds[3])
+        # point without time is bridged
+        self.assertAlmostEqual(speeds[4], 11.1, 1)
+
+        (movingTime, stoppedTime, movingDist, stoppedDist, maxSpeed) = track.getMovingData()
+        self.assertEquals(movingTime, 30)
+        self.assertEquals(stoppedTime, 60)
+        self.assertAlmostEqual(movingDist, 333.6, 1)
+        self.assertAlmostEqual(maxSpeed, 11.1, 1)
+        self.assertAlmostEqual(track.getAverageSpeed(), 11.1, 1)
+        self.assertAlmostEqual(segment.getAverageSpeed(), 11.1, 1)
+        self.assertAlmostEqual(track.getAveragePace(), 89.9, 1)
+        self.assertAlmostEqual(segment.getAveragePace(), 89.9, 1)
+
+        self.assertEquals(track.getStartTime(), datetime.datetime(2015, 2, 23, 10, 0, 0))
+        self.assertEquals(track.getBounds(), (49.0, 49.003, 16.0, 16.0))
+        self.assertEquals(GpxTrack().getBounds(), (None, None, None, None))
+
+        self.assertEquals(GpxTrackSegment().getSpeeds(), [])
+        self.assertIsNone(GpxTrack().getAverageSpeed())
+        self.assertIsNone(GpxTrack().getAveragePace())
+        self.assertIsNone(GpxTrackSegment().getAveragePace())
+
+    def testTrackMaxSpeed(self):
+        t0 = datetime.datetime(2015, 2, 23, 10, 0, 0)
+        track = GpxTrack()
+        # ~1.1, 2.2, 3.3, 4.4 m/s
+        segment = GpxTrackSegment()
+        lat = 49.0
+        for i in xrange(5):
+            segment.points.append(GpxTrackPoint(lat, 16, time=t0 + datetime.timedelta(seconds=10 * i)))
+            lat += (i + 1) * 0.0001
+        track.segments.append(segment)
+        # ~111 m/s
+        track.segments.append(GpxTrackSegment([GpxTrackPoint(50, 16, time=t0), GpxTrackPoint(50.01, 16, time=t0 + datetime.timedelta(seconds=10))]))
+
+        # percentile over intervals of all segments
+        (_, _, _, _, maxSpeed) = track.getMovingData(maxSpeedPercentile=50)
+        self.assertAlmostEqual(maxSpeed, 3.3, 1)
+        (_, _, _, _, maxSpeed) = track.getMovingData(maxSpeedPercentile=100)
+        self.assertAlmostEqual(maxSpeed, 111.2, 1)
+        (_, _, _, _, maxSpeed) = track.segments[0].getMovingData(maxSpeedPercentile=50)
+        self.assertAlmostEqual(maxSpeed, 2.2, 1)
+
 if __name__ == '__main__':
     unittest.main()
 
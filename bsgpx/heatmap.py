@@ -0,0 +1,393 @@
+import StringIO
+import array
+import math
+import pickle
+import unittest
+import xml.dom.minidom
+import gpx
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PROJECTION_LATLON = 'latlon'
+PROJECTION_MERCATOR = 'mercator'
+
+# latitude limit of Web Mercator
+MERCATOR_MAX_LAT = 85.0511287798
+
+def mercatorY(lat):
+    """Web Mercator y (0 at equator, 1 at MERCATOR_MAX_LAT) of latitude"""
+    lat = max(min(lat, MERCATOR_MAX_LAT), -MERCATOR_MAX_LAT)
+    return math.log(math.tan(math.pi / 4 + lat / 180.0 * math.pi / 2)) / math.pi
+
+def tileExtent(zoom, x, y):
+    """Extent (minLat, maxLat, minLon, maxLon) of Web Mercator (slippy map) tile"""
+    n = 2.0 ** zoom
+    def lat(ty):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * ty / n))))
+    return (lat(y + 1), lat(y), x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0)
+
+def clipSegment(x1, y1, x2, y2, width, height):
+    """
+    Clip line segment to rectangle (0, 0) - (width, height).
+
+    Liang-Barsky algorithm, returns clipped segment (x1, y1, x2, y2) or
+    None if segment does not intersect the rectangle.
+    """
+    dx = x2 - x1
+    dy = y2 - y1
+    t0 = 0.0
+    t1 = 1.0
+    for p, q in ((-dx, x1), (dx, width - x1), (-dy, y1), (dy, height - y1)):
+        if p == 0:
+            if q < 0:
+                return None
+            continue
+        r = q / float(p)
+        if p < 0:
+            if r > t1:
+                return None
+            t0 = max(t0, r)
+        else:
+            if r < t0:
+                return None
+            t1 = min(t1, r)
+    return (x1 + t0 * dx, y1 + t0 * dy, x1 + t1 * dx, y1 + t1 * dy)
+
+class DensityGrid:
+    """Density grid of fixed extent accumulating points or lines of tracks
+
+    Cells are stored row by row (first row is north edge) in flat array,
+    numpy array if numpy is available (binning is vectorized then) or
+    array.array otherwise. Grids of the same extent and size can be
+    merged, so the work can be split across processes.
+    """
+
+    def __init__(self, extent, width, height, projection=PROJECTION_LATLON):
+        if projection not in (PROJECTION_LATLON, PROJECTION_MERCATOR):
+            raise ValueError('Unknown projection: %s' % projection)
+        (minLat, maxLat, minLon, maxLon) = extent
+        if minLat >= maxLat or minLon >= maxLon or width <= 0 or height <= 0:
+            raise ValueError('Invalid grid extent or size')
+
+        self.extent = tuple(extent)
+        self.width = width
+        self.height = height
+        self.projection = projection
+        self.vectorized = numpy is not None
+        if self.vectorized:
+            self.cells = numpy.zeros(width * height)
+        else:
+            self.cells = array.array('d', [0.0]) * (width * height)
+
+        self._x0 = minLon
+        self._xScale = width / float(maxLon - minLon)
+        self._y0 = self._projectLat(maxLat)
+        self._yScale = height / float(self._y0 - self._projectLat(minLat))
+
+    @staticmethod
+    def forTile(zoom, x, y, size=256):
+        """Grid covering Web Mercator tile"""
+        return DensityGrid(tileExtent(zoom, x, y), size, size, PROJECTION_MERCATOR)
+
+    def _projectLat(self, lat):
+        return mercatorY(lat) if self.projection == PROJECTION_MERCATOR else lat
+
+    def _pixels(self, lats, lons):
+        """Pixel (fractional) coordinates of columns of locations"""
+        if self.vectorized:
+            xs = (numpy.asarray(lons, dtype=float) - self._x0) * self._xScale
+            lats = numpy.asarray(lats, dtype=float)
+            if self.projection == PROJECTION_MERCATOR:
+                lats = numpy.clip(lats, -MERCATOR_MAX_LAT, MERCATOR_MAX_LAT)
+                lats = numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(lats) / 2)) / numpy.pi
+            ys = (self._y0 - lats) * self._yScale
+            return (xs, ys)
+
+        xs = [(lon - self._x0) * self._xScale for lon in lons]
+        if self.projection == PROJECTION_MERCATOR:
+            lats = map(mercatorY, lats)
+        ys = [(self._y0 - lat) * self._yScale for lat in lats]
+        return (xs, ys)
+
+    def _cellIndices(self, xs, ys):
+        """Indices of cells of pixels (numpy arrays) inside of grid"""
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return ys[inside].astype(int) * self.width + xs[inside].astype(int)
+
+    def _accumulate(self, xs, ys, weight, unique=False):
+        """Add weight to cells of pixels, consecutive repeats of cell are counted once if unique is set"""
+        if self.vectorized:
+            ixs = self._cellIndices(xs, ys)
+            if unique and len(ixs) > 1:
+                ixs = ixs[numpy.concatenate(([True], ixs[1:] != ixs[:-1]))]
+            self.cells += numpy.bincount(ixs, minlength=len(self.cells)) * weight
+            return
+
+        last = None
+        cells = self.cells
+        width = self.width
+        height = self.height
+        for x, y in zip(xs, ys):
+            if 0 <= x < width and 0 <= y < height:
+                ix = int(y) * width + int(x)
+                if not unique or ix != last:
+                    cells[ix] += weight
+                    last = ix
+
+    def addPoints(self, lats, lons, weight=1.0):
+        """Add locations given as columns of coordinates"""
+        (xs, ys) = self._pixels(lats, lons)
+        self._accumulate(xs, ys, weight)
+
+    def _sampleLines(self, xs, ys):
+        """
+        Samples of polyline, at most one pixel apart.
+
+        Each line segment is clipped to the grid first, so only the part
+        crossing the grid is sampled (number of samples is bounded by grid
+        size, regardless of segment length).
+        """
+        if self.vectorized:
+            x1 = xs[:-1]
+            y1 = ys[:-1]
+            dx = xs[1:] - x1
+            dy = ys[1:] - y1
+
+            # Liang-Barsky clipping of all segments
+            t0 = numpy.zeros(len(dx))
+            t1 = numpy.ones(len(dx))
+            valid = numpy.ones(len(dx), dtype=bool)
+            with numpy.errstate(divide='ignore', invalid='ignore'):
+                for p, q in ((-dx, x1), (dx, self.width - x1), (-dy, y1), (dy, self.height - y1)):
+                    valid &= ~((p == 0) & (q < 0))
+                    r = q / p
+                    t0 = numpy.where(p < 0, numpy.maximum(t0, r), t0)
+                    t1 = numpy.where(p > 0, numpy.minimum(t1, r), t1)
+            valid &= t0 <= t1
+
+            cx = (x1 + t0 * dx)[valid]
+            cy = (y1 + t0 * dy)[valid]
+            cdx = (x1 + t1 * dx)[valid] - cx
+            cdy = (y1 + t1 * dy)[valid] - cy
+
+            # samples including both end points of each clipped segment
+            steps = numpy.ceil(numpy.maximum(numpy.abs(cdx), numpy.abs(cdy))).astype(int)
+            counts = steps + 1
+            segments = numpy.repeat(numpy.arange(len(counts)), counts)
+            ixs = numpy.arange(counts.sum()) - numpy.repeat(numpy.cumsum(counts) - counts, counts)
+            stepXs = cdx / numpy.maximum(steps, 1)
+            stepYs = cdy / numpy.maximum(steps, 1)
+            return (cx[segments] + stepXs[segments] * ixs, cy[segments] + stepYs[segments] * ixs)
+
+        sampleXs = []
+        sampleYs = []
+        for x1, y1, x2, y2 in zip(xs, ys, xs[1:], ys[1:]):
+            clipped = clipSegment(x1, y1, x2, y2, self.width, self.height)
+            if clipped is None:
+                continue
+            (x1, y1, x2, y2) = clipped
+            steps = int(math.ceil(max(abs(x2 - x1), abs(y2 - y1))))
+            dx = (x2 - x1) / max(steps, 1)
+            dy = (y2 - y1) / max(steps, 1)
+            sampleXs.extend([x1 + dx * i for i in xrange(steps + 1)])
+            sampleYs.extend([y1 + dy * i for i in xrange(steps + 1)])
+        return (sampleXs, sampleYs)
+
+    def addLines(self, lats, lons, weight=1.0):
+        """Add polyline given as columns of coordinates, each pixel crossed by line is counted once per crossing"""
+        (xs, ys) = self._pixels(lats, lons)
+        if len(xs) < 2:
+            self._accumulate(xs, ys, weight)
+            return
+
+        (sampleXs, sampleYs) = self._sampleLines(xs, ys)
+        self._accumulate(sampleXs, sampleYs, weight, unique=True)
+
+    def addTrack(self, track, lines=True, weight=1.0):
+        add = self.addLines if lines else self.addPoints
+        for s in track.segments:
+            add([p.lat for p in s.points], [p.lon for p in s.points], weight)
+
+    def addGpx(self, gpxData, lines=True, weight=1.0):
+        for track in gpxData.tracks:
+            self.addTrack(track, lines, weight)
+
+    def addFiles(self, paths, lines=True, weight=1.0):
+        """Add tracks of GPX files, files are parsed one by one"""
+        for path in paths:
+            self.addGpx(gpx.GpxReaderXml(path).gpx, lines, weight)
+
+    def merge(self, other):
+        """Add counts of other grid of the same extent, size and projection"""
+        if (self.extent, self.width, self.height, self.projection) != (other.extent, other.width, other.height, other.projection):
+            raise ValueError('Grids are not compatible')
+        if self.vectorized:
+            self.cells += numpy.asarray(other.cells, dtype=float)
+            return
+        cells = self.cells
+        for ix, value in enumerate(other.cells):
+            if value:
+                cells[ix] += value
+
+    def getMax(self):
+        return max(self.cells) if len(self.cells) else 0
+
+    def toNumpy(self):
+        """Grid as NumPy array of shape (height, width)"""
+        if numpy is None:
+            raise RuntimeError('numpy is required for conversion to array')
+        return numpy.array(self.cells, dtype=float).reshape((self.height, self.width))
+
+    def toPgm(self, f, logScale=True):
+        """Write grid as binary (P5) 8-bit PGM image to file object f"""
+        maxValue = self.getMax()
+        f.write('P5\n%d %d\n255\n' % (self.width, self.height))
+
+        if self.vectorized:
+            if maxValue > 0 and logScale:
+                pixels = numpy.log1p(self.cells) * (255.0 / math.log1p(maxValue))
+            elif maxValue > 0:
+                pixels = self.cells * (255.0 / maxValue)
+            else:
+                pixels = numpy.zeros(len(self.cells))
+            f.write(pixels.astype(numpy.uint8).tostring())
+            return
+
+        if maxValue > 0 and logScale:
+            norm = 255.0 / math.log1p(maxValue)
+            pixels = [int(math.log1p(v) * norm) for v in self.cells]
+        elif maxValue > 0:
+            norm = 255.0 / maxValue
+            pixels = [int(v * norm) for v in self.cells]
+        else:
+            pixels = [0] * len(self.cells)
+
+        f.write(array.array('B', pixels).tostring())
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition
+
+    Tests are run with numpy (if installed) and with pure Python fallback.
+    """
+
+    def run(self, result=None):
+        global numpy
+        super(UnitTests, self).run(result)
+        if numpy is not None:
+            savedNumpy = numpy
+            try:
+                numpy = None
+                super(UnitTests, self).run(result)
+            finally:
+                numpy = savedNumpy
+
+    def testPoints(self):
+        grid = DensityGrid((0, 10, 0, 10), 10, 10)
+        self.assertEqual(grid.vectorized, numpy is not None)
+        grid.addPoints([0.5, 0.5, 9.5, 20], [0.5, 0.5, 9.5, 5])
+        self.assertEqual(grid.cells[9 * 10 + 0], 2)
+        self.assertEqual(grid.cells[0 * 10 + 9], 1)
+        self.assertEqual(sum(grid.cells), 3)
+
+    def testLines(self):
+        grid = DensityGrid((0, 10, 0, 10), 10, 10)
+        grid.addLines([0.5, 0.5], [0.5, 9.5])
+        self.assertEqual(list(grid.cells[90:100]), [1.0] * 10)
+        self.assertEqual(sum(grid.cells), 10)
+
+        grid.addLines([0.5], [0.5])
+        self.assertEqual(grid.cells[90], 2)
+
+        # polyline going back and forth, pixels are counted once per crossing
+        grid = DensityGrid((0, 10, 0, 10), 10, 10)
+        grid.addLines([0.5, 0.5, 0.5], [0.5, 2.5, 0.5])
+        self.assertEqual(list(grid.cells[90:93]), [2.0, 2.0, 1.0])
+
+    def testLinesClipping(self):
+        # both end points outside of grid
+        grid = DensityGrid((49, 50, 16, 17), 10, 10)
+        grid.addLines([49.5, 49.5], [0, 40])
+        self.assertEqual(list(grid.cells[50:60]), [1.0] * 10)
+        self.assertEqual(sum(grid.cells), 10)
+
+        # diagonal crossing, one end point inside
+        grid = DensityGrid((0, 10, 0, 10), 10, 10)
+        grid.addLines([-100, 5.5], [-100, 5.5])
+        self.assertEqual(grid.cells[9 * 10 + 0], 1)
+        self.assertEqual(grid.cells[4 * 10 + 5], 1)
+        self.assertTrue(6 <= sum(grid.cells) <= 11)
+
+        # segment missing the grid
+        grid = DensityGrid((0, 10, 0, 10), 10, 10)
+        grid.addLines([-1, -1, 20], [-5, 20, 20])
+        self.assertEqual(sum(grid.cells), 0)
+
+        self.assertIsNone(clipSegment(-1, -1, -1, 20, 10, 10))
+        self.assertEqual(clipSegment(-10, 5, 20, 5, 10, 10), (0, 5, 10, 5))
+        self.assertEqual(clipSegment(1, 2, 3, 4, 10, 10), (1, 2, 3, 4))
+
+    def testHighZoomTile(self):
+        # sparse points far outside of small tile, line crosses the tile
+        grid = DensityGrid.forTile(16, 35791, 22504, 64)
+        (minLat, maxLat, minLon, maxLon) = grid.extent
+        lat = (minLat + maxLat) / 2
+        grid.addLines([lat, lat], [minLon - 1, maxLon + 1])
+        self.assertEqual(sum(grid.cells), 64)
+
+    def testMercator(self):
+        grid = DensityGrid.forTile(0, 0, 0, 4)
+        grid.addPoints([0.1, 80, -80], [0.1, -170, 170])
+        self.assertEqual(grid.cells[2 * 4 + 2], 0)
+        self.assertEqual(grid.cells[1 * 4 + 2], 1)
+        self.assertEqual(grid.cells[0 * 4 + 0], 1)
+        self.assertEqual(grid.cells[3 * 4 + 3], 1)
+
+        (minLat, maxLat, minLon, maxLon) = tileExtent(1, 1, 0)
+        self.assertAlmostEqual(minLat, 0)
+        self.assertAlmostEqual(maxLat, MERCATOR_MAX_LAT)
+        self.assertEqual((minLon, maxLon), (0, 180))
+
+    def testMergeAndGpx(self):
+        data = ('<gpx>\n'
+                '  <trk>\n'
+                '    <trkseg>\n'
+                '      <trkpt lat="49.05" lon="16.05"></trkpt>\n'
+                '      <trkpt lat="49.05" lon="16.95"></trkpt>\n'
+                '    </trkseg>\n'
+                '  </trk>\n'
+                '</gpx>\n')
+        gpxData = gpx.GpxReaderXml(xml.dom.minidom.parseString(data)).gpx
+
+        g1 = DensityGrid((49, 50, 16, 17), 10, 10)
+        g1.addGpx(gpxData)
+        g2 = DensityGrid((49, 50, 16, 17), 10, 10)
+        g2.addGpx(gpxData, lines=False)
+        # grid is transferred between processes by pickle
+        g1.merge(pickle.loads(pickle.dumps(g2, pickle.HIGHEST_PROTOCOL)))
+        self.assertEqual(list(g1.cells[90:100]), [2.0] + [1.0] * 8 + [2.0])
+        self.assertRaises(ValueError, g1.merge, DensityGrid((49, 50, 16, 17), 5, 5))
+
+        f = StringIO.StringIO()
+        g1.toPgm(f)
+        self.assertTrue(f.getvalue().startswith('P5\n10 10\n255\n'))
+        self.assertEqual(len(f.getvalue()), len('P5\n10 10\n255\n') + 100)
+        self.assertEqual(f.getvalue()[-1], chr(255))
+        self.assertEqual(f.getvalue()[-2], chr(int(math.log1p(1) * 255 / math.log1p(2))))
+        self.assertEqual(f.getvalue()[-11], chr(0))
+
+        if numpy is not None:
+            a = g1.toNumpy()
+            self.assertEqual(a.shape, (10, 10))
+            self.assertEqual(a[9, 0], 2)
+
+    def testInvalid(self):
+        self.assertRaises(ValueError, DensityGrid, (0, 0, 0, 10), 10, 10)
+        self.assertRaises(ValueError, DensityGrid, (0, 1, 0, 1), 10, 10, 'xxx')
+
+if __name__ == '__main__':
+    unittest.main()
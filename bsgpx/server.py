@@ -0,0 +1,178 @@
+import SocketServer
+import StringIO
+import collections
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import unittest
+import client
+import gpx
+import textcommands
+
+class GpxCache:
+    """Bounded LRU cache of parsed GPX files and outputs of commands
+
+    Entry is valid while size and mtime of the file are unchanged.
+    """
+
+    def __init__(self, maxSize=128):
+        self.maxSize = maxSize
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _getEntry(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_size, st.st_mtime)
+
+        with self.lock:
+            entry = self.entries.pop(path, None)
+            if entry is not None and entry['key'] == key:
+                self.entries[path] = entry
+                return entry
+
+        # parse outside of lock, other clients are not blocked
+        entry = {'key': key, 'gpx': gpx.GpxReaderXml(path).gpx, 'outputs': {}, 'lock': threading.Lock()}
+
+        with self.lock:
+            self.entries[path] = entry
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+
+        return entry
+
+    def getGpx(self, path):
+        return self._getEntry(path)['gpx']
+
+    def getOutput(self, path, cmd):
+        """Text output of command for given file"""
+        entry = self._getEntry(path)
+        with entry['lock']:
+            if cmd not in entry['outputs']:
+                out = StringIO.StringIO()
+                textcommands.execute(entry['gpx'], cmd, out)
+                entry['outputs'][cmd] = out.getvalue()
+            return entry['outputs'][cmd]
+
+class GpxRequestHandler(SocketServer.StreamRequestHandler):
+    """Handles requests, one JSON object per line
+
+    Request: {"path": "file.gpx", "commands": ["list", ...]}
+    Response: {"ok": true, "output": "..."} or {"ok": false, "error": "..."}
+    """
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                output = ''.join(self.server.cache.getOutput(request['path'], cmd) for cmd in request['commands'])
+                response = {'ok': True, 'output': output}
+            except Exception as e:
+                response = {'ok': False, 'error': str(e) or e.__class__.__name__}
+            self.wfile.write(json.dumps(response) + '\n')
+            self.wfile.flush()
+
+class GpxUnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+class GpxTcpServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def createServer(address, cacheSize=128):
+    """Create server (thread per client) listening on unix socket or tcp address"""
+    address = client.parseAddress(address)
+    if isinstance(address, tuple):
+        server = GpxTcpServer(address, GpxRequestHandler)
+    else:
+        # remove stale socket of previous server, never other files
+        if os.path.exists(address):
+            if not stat.S_ISSOCK(os.stat(address).st_mode):
+                raise IOError('File exists and is not a socket: %s' % address)
+            os.remove(address)
+        server = GpxUnixServer(address, GpxRequestHandler)
+    server.cache = GpxCache(cacheSize)
+    return server
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    DATA = ('<gpx creator="test">\n'
+            '  <trk>\n'
+            '    <trkseg>\n'
+            '      <trkpt lat="49.000" lon="16"><ele>200</ele></trkpt>\n'
+            '      <trkpt lat="49.001" lon="16"><ele>210</ele></trkpt>\n'
+            '    </trkseg>\n'
+            '  </trk>\n'
+            '</gpx>\n')
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.paths = []
+        for name in ('a.gpx', 'b.gpx', 'c.gpx'):
+            path = os.path.join(self.dir, name)
+            with open(path, 'w') as f:
+                f.write(self.DATA)
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def testCache(self):
+        cache = GpxCache(2)
+        g = cache.getGpx(self.paths[0])
+        self.assertTrue(cache.getGpx(self.paths[0]) is g)
+        self.assertEqual(cache.getOutput(self.paths[0], 'ele'), '    Points: 2\n')
+
+        cache.getGpx(self.paths[1])
+        cache.getGpx(self.paths[0])
+        cache.getGpx(self.paths[2])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(list(cache.entries), [self.paths[0], self.paths[2]])
+
+        # modified file is parsed again
+        os.utime(self.paths[0], (0, 0))
+        self.assertFalse(cache.getGpx(self.paths[0]) is g)
+
+    def testAddress(self):
+        self.assertRaises(ValueError, createServer, '0.0.0.0:9000')
+
+        # regular file is never replaced by socket
+        self.assertRaises(IOError, createServer, self.paths[0])
+        with open(self.paths[0]) as f:
+            self.assertEqual(f.read(), self.DATA)
+
+        # stale socket is replaced
+        address = os.path.join(self.dir, 'gpx.sock')
+        createServer(address).server_close()
+        createServer(address).server_close()
+
+    def testServer(self):
+        for address in (os.path.join(self.dir, 'gpx.sock'), 'localhost:0'):
+            server = createServer(address)
+            if not isinstance(server.server_address, str):
+                address = '%s:%d' % server.server_address
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            try:
+                self.assertEqual(client.request(address, self.paths[0], ['ele', 'ele']), '    Points: 2\n' * 2)
+                self.assertTrue(client.request(address, self.paths[1], ['list']).startswith('Creator: test\n'))
+                self.assertRaises(RuntimeError, client.request, address, self.paths[0], ['xxx'])
+                self.assertRaises(RuntimeError, client.request, address, os.path.join(self.dir, 'x.gpx'), ['list'])
+            finally:
+                server.shutdown()
+                server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
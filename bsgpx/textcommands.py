@@ -0,0 +1,84 @@
+import StringIO
+import unittest
+import xml.dom.minidom
+import client
+import geo
+import gpx
+
+def cmdEle(gpxFile, out):
+    for t in gpxFile.tracks:
+        for s in t.segments:
+            print >> out, '    Points:', len(s.points)
+
+def cmdList(gpxFile, out):
+    if gpxFile.creator:
+        print >> out, 'Creator:', gpxFile.creator
+    if gpxFile.name:
+        print >> out, 'Name:', gpxFile.name
+    print >> out, 'Tracks:', len(gpxFile.tracks)
+
+    for t in gpxFile.tracks:
+        (upSmooth, downSmooth) = t.getUpDownHill(True)
+        (up, down) = t.getUpDownHill(False)
+        print >> out, '  Length 2d:', t.length2d() / 1000, 'kilometers'
+        print >> out, '  Length 3d:', t.length3d() / 1000, 'kilometers'
+        print >> out, '  Up:', up, 'smooth:', upSmooth
+        print >> out, '  Down:', down, 'smooth:', downSmooth
+        (movingTime, stoppedTime, movingDistance, _, maxSpeed) = t.getMovingData()
+        avgSpeed = geo.getAverageSpeed(movingDistance, movingTime)
+        print >> out, '  Duration:', t.getDuration(), 'seconds'
+        print >> out, '  Moving time:', movingTime, 'seconds', 'stopped:', stoppedTime
+        if avgSpeed is not None:
+            print >> out, '  Avg speed:', avgSpeed * 3.6, 'km/h', 'max:', maxSpeed * 3.6
+            print >> out, '  Avg pace:', geo.getPace(movingDistance, movingTime), 'seconds/km'
+
+        print >> out, '  Segments:', len(t.segments)
+        for s in t.segments:
+            print >> out, '    Points:', len(s.points)
+
+def cmdPrint(gpxFile, out):
+    print >> out, gpxFile
+
+# commands producing text output for single gpx file
+COMMANDS = {
+    'ele': cmdEle,
+    'list': cmdList,
+    'print': cmdPrint,
+}
+
+def execute(gpxFile, cmd, out):
+    if cmd not in COMMANDS:
+        raise ValueError('Unknown command: %s' % cmd)
+    COMMANDS[cmd](gpxFile, out)
+
+### Unit Testing #########################################
+
+class UnitTests(unittest.TestCase):
+    """Unit tests definition"""
+
+    def testCommands(self):
+        data = ('<gpx creator="test">\n'
+                '  <trk>\n'
+                '    <trkseg>\n'
+                '      <trkpt lat="49.000" lon="16"><ele>200</ele><time>2015-02-23T10:00:00Z</time></trkpt>\n'
+                '      <trkpt lat="49.001" lon="16"><ele>210</ele><time>2015-02-23T10:00:10Z</time></trkpt>\n'
+                '    </trkseg>\n'
+                '  </trk>\n'
+                '</gpx>\n')
+        gpxFile = gpx.GpxReaderXml(xml.dom.minidom.parseString(data)).gpx
+
+        out = StringIO.StringIO()
+        execute(gpxFile, 'list', out)
+        self.assertTrue(out.getvalue().startswith('Creator: test\nTracks: 1\n'))
+
+        out = StringIO.StringIO()
+        execute(gpxFile, 'ele', out)
+        self.assertEqual(out.getvalue(), '    Points: 2\n')
+
+        self.assertRaises(ValueError, execute, gpxFile, 'xxx', out)
+
+        # client validates commands without importing this module
+        self.assertEqual(sorted(COMMANDS), sorted(client.TEXT_COMMANDS))
+
+if __name__ == '__main__':
+    unittest.main()
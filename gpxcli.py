@@ -1,15 +1,21 @@
 import argparse
 import sys
+import socket
 import ConfigParser
-import bsgpx.gpx
+# modules importing numpy are imported only when needed, client of server (-S) stays cheap
+import bsgpx.client
 
-epilog = 'Commands: list, print, ele'
+epilog = 'Commands: list, print, ele, export. Use --serve to run resident server and -S to query it.'
 parser = argparse.ArgumentParser(description='Tool for reading and processing files in GPX format', epilog=epilog) 
-parser.add_argument('gpx_file_path', help='Input GPX file')
-parser.add_argument('command', help='Commands to be executed', nargs='+')
+parser.add_argument('gpx_file_path', help='Input GPX file', nargs='?')
+parser.add_argument('command', help='Commands to be executed', nargs='*')
 parser.add_argument('-l', help='List items in GPX file', action='store_true')
 parser.add_argument('-p', help='Generate track(s) profile', action='store_true')
 parser.add_argument('-c', help='Path to configuration file')
+parser.add_argument('-o', help='Output file for export command (.csv or .npz)')
+parser.add_argument('-S', help='Send commands to server listening on unix socket path or host:port')
+parser.add_argument('--serve', help='Run server listening on unix socket path or host:port', metavar='ADDRESS')
+parser.add_argument('--cache-size', help='Number of files kept in server cache', type=int, default=128)
 
 args = parser.parse_args()
 
@@ -20,39 +26,57 @@ if args.c:
     config.read(args.c)
     print config.get('elevation', 'provider')
 
+# run resident server, requests are served until interrupted
+if args.serve:
+    import bsgpx.server
+    try:
+        server = bsgpx.server.createServer(args.serve, args.cache_size)
+    except (IOError, ValueError) as e:
+        parser.error(str(e))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    sys.exit(0)
+
+if not args.gpx_file_path or not args.command:
+    parser.error('gpx_file_path and command are required')
+
+for cmd in args.command:
+    if cmd != 'export' and cmd not in bsgpx.client.TEXT_COMMANDS:
+        parser.error('unknown command: %s' % cmd)
+
+# check export options before file is parsed
+if 'export' in args.command and not args.S:
+    import bsgpx.export
+    if not args.o:
+        parser.error('export command requires output file (-o)')
+    if bsgpx.export.getFormat(args.o) is None:
+        parser.error('unsupported export format of %s (use %s)' % (args.o, ', '.join(bsgpx.export.FORMATS)))
+
+# pass text commands to running server
+if args.S:
+    if 'export' in args.command:
+        parser.error('export command is not supported by server')
+    try:
+        sys.stdout.write(bsgpx.client.request(args.S, args.gpx_file_path, args.command))
+    except (socket.error, IOError, ValueError, RuntimeError) as e:
+        parser.error('server %s: %s' % (args.S, e))
+    sys.exit(0)
+
+import bsgpx.gpx
+import bsgpx.textcommands
+
 # create instance of check processor (check that file exists)
 gpxReader = bsgpx.gpx.GpxReaderXml(args.gpx_file_path)
 gpxFile = gpxReader.gpx
 
 for cmd in args.command:
 
-    # if adding elevation data is requested
-    if cmd == 'ele':
-        for t in gpxFile.tracks:
-            for s in t.segments:
-                print '    Points:', len(s.points)
-
-    # if list of ids is requested
-    if cmd == 'list':
-        if gpxFile.creator:
-            print 'Creator:', gpxFile.creator
-        if gpxFile.name:
-            print 'Name:', gpxFile.name
-        print 'Tracks:', len(gpxFile.tracks)
-
-        for t in gpxFile.tracks:
-            (upSmooth, downSmooth) = t.getUpDownHill(True)
-            (up, down) = t.getUpDownHill(False)
-            print '  Length 2d:', t.length2d() / 1000, 'kilometers'
-            print '  Length 3d:', t.length3d() / 1000, 'kilometers'
-            print '  Up:', up, 'smooth:', upSmooth 
-            print '  Down:', down, 'smooth:', downSmooth
-
-            print '  Segments:', len(t.segments)
-            for s in t.segments:
-                print '    Points:', len(s.points)
-
-    # if gpx print is requested
-    elif cmd == 'print':
-        print gpxFile
-
+    # if export of points is requested
+    if cmd == 'export':
+        bsgpx.export.export(gpxFile, args.o)
+    else:
+        bsgpx.textcommands.execute(gpxFile, cmd, sys.stdout)